@@ -0,0 +1,299 @@
+import gc
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+import subprocess
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+import feed
+import nuxt
+import cache
+import scraper
+import poster_cache
+import records
+import rendering
+import stub_upstream
+from stub_upstream import fixture_text
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse, Response
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+def _detail_nuxt() -> tuple[list, int]:
+    data = nuxt.decode(fixture_text("detail.html"))
+    for i, v in enumerate(data):
+        if isinstance(v, dict) and "subjectId" in v and "title" in v and "duration" in v:
+            return data, i
+    raise RuntimeError("detail fixture has no subject dict")
+
+# Feeds the page in network-sized chunks, as fetch_nuxt does
+def _stream_nuxt(html: str, chunk: int = 16384) -> list:
+    stream = nuxt.ArrayStream()
+    data = []
+    for start in range(0, len(html), chunk):
+        data.extend(value for _, value in stream.feed(html[start:start + chunk]))
+        if stream.done:
+            break
+    stream.close()
+    return data
+
+def _soup(name: str) -> BeautifulSoup:
+    return BeautifulSoup(fixture_text(name), "html.parser")
+
+def build_cases() -> dict:
+    home_html = fixture_text("homepage.html")
+    movie_html = fixture_text("movie.html")
+    tv_html = fixture_text("tv-series.html")
+    ranking_html = fixture_text("ranking.html")
+
+    home_soup = _soup("homepage.html")
+    movie_soup = _soup("movie.html")
+    tv_soup = _soup("tv-series.html")
+    ranking_soup = _soup("ranking.html")
+
+    home_bmap = scraper.build_blurhash_to_poster_map(home_html)
+    home_tmap = scraper.build_title_to_poster_map(home_html)
+    movie_bmap = scraper.build_blurhash_to_poster_map(movie_html)
+    movie_smap = scraper.build_slug_to_poster_map(movie_html)
+    tv_smap = scraper.build_slug_to_poster_map(tv_html)
+    ranking_smap = scraper.build_slug_to_poster_map(ranking_html)
+    detail_data, subject_idx = _detail_nuxt()
+
+    # Endpoint cases call the handlers directly with the stand-in upstream installed
+    # and serialize the result the way FastAPI would, never from a response cache
+    stub_upstream.install()
+    cache.BACKEND = None
+    loop = asyncio.new_event_loop()
+
+    def run(coro):
+        result = loop.run_until_complete(coro)
+        if isinstance(result, Response):
+            return result.body
+        return rendering.TimedJSONResponse(jsonable_encoder(result)).body
+
+    cases = {
+        "html_parse[movie]": lambda: BeautifulSoup(movie_html, "html.parser"),
+        "parse_sections": lambda: scraper.parse_sections(home_soup, home_bmap),
+        "parse_banner": lambda: scraper.parse_banner(home_soup, home_tmap),
+        "parse_card_page": lambda: scraper.parse_card_page(tv_soup, tv_smap),
+        "parse_ranking_page": lambda: scraper.parse_ranking_page(ranking_soup, ranking_smap),
+        "parse_movie_filter_page": lambda: scraper.parse_movie_filter_page(movie_soup, movie_bmap, movie_smap, movie_html),
+        "build_blurhash_to_poster_map": lambda: scraper.build_blurhash_to_poster_map(home_html),
+        "build_slug_to_poster_map": lambda: scraper.build_slug_to_poster_map(tv_html),
+        "build_title_to_poster_map": lambda: scraper.build_title_to_poster_map(home_html),
+        "_resolve_nuxt_data": lambda: scraper._resolve_nuxt_data(detail_data, subject_idx),
+        "nuxt_decode[movie]": lambda: nuxt.decode(movie_html),
+        "nuxt_stream[movie]": lambda: _stream_nuxt(movie_html),
+        "endpoint[/home]": lambda: run(feed.get_home()),
+        "endpoint[/movies]": lambda: run(scraper.get_movies()),
+        "endpoint[/tv-series]": lambda: run(scraper.get_tv_series()),
+        "endpoint[/ranking]": lambda: run(scraper.get_ranking()),
+        "endpoint[/detail]": lambda: run(scraper.get_movie_detail("bench-slug-OlanoKZKGR2")),
+        "endpoint[/search]": lambda: run(feed.get_search_results("avatar")),
+        "endpoint[/api/stream]": lambda: run(feed.get_stream_sources("1", "bench-slug-OlanoKZKGR2")),
+    }
+    if poster_cache.pillow() is not None:
+        poster = os.path.join(stub_upstream.FIXTURE_DIR, stub_upstream.POSTER_FIXTURE)
+        cases["poster_render[150.webp]"] = lambda: poster_cache._render_variant(poster, 150, "webp")
+        cases["poster_render[300.jpeg]"] = lambda: poster_cache._render_variant(poster, 300, "jpeg")
+    return cases
+
+def measure(func, min_time: float, repeat: int) -> dict:
+    # Calibrate the loop count so each sample runs for at least min_time
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return {
+        "median_ms": statistics.median(samples) * 1000,
+        "min_ms": min(samples) * 1000,
+        "loops": number,
+    }
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        # min is the least noisy estimate on a shared machine
+        ratio = result["min_ms"] / base["min_ms"]
+        result["vs_baseline"] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            regressions.append(f"{name}: {result['min_ms']:.3f} ms vs baseline {base['min_ms']:.3f} ms ({ratio:.2f}x)")
+    return regressions
+
+def build_catalogs() -> list:
+    stub_upstream.install()
+
+    async def collect():
+        home = await feed._home_data()
+        tabs = [await scraper._tab_sections(path) for path in ("/web/movie", "/web/tv-series", "/web/animated-series", "/ranking-list")]
+        return [home["sections"]] + [sections for sections, _ in tabs]
+
+    return asyncio.run(collect())
+
+def _retained_bytes(build) -> tuple[int, object]:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    value = build()
+    # Parsed soups are reference cycles; collect them so only the kept catalogs count
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, value
+
+def memory_report(copies: int) -> dict:
+    catalogs = build_catalogs()
+    payload = records.dumps(catalogs)
+    # The dict representation is exactly what the endpoints used to build
+    legacy = json.loads(payload)
+    if JSONResponse(legacy).body != payload:
+        raise RuntimeError("record serialization is not byte-compatible with the dict representation")
+
+    cards = sum(s.count for sections in catalogs for s in sections)
+    dict_bytes, _ = _retained_bytes(lambda: [json.loads(payload) for _ in range(copies)])
+    # Re-parse fixtures from scratch so record strings are not shared with the dicts above
+    record_bytes, _ = _retained_bytes(lambda: [build_catalogs() for _ in range(copies)])
+    return {
+        "copies": copies,
+        "cards_per_copy": cards,
+        "dict_bytes": dict_bytes,
+        "record_bytes": record_bytes,
+        "dict_bytes_per_card": round(dict_bytes / (cards * copies), 1),
+        "record_bytes_per_card": round(record_bytes / (cards * copies), 1),
+        "ratio": round(record_bytes / dict_bytes, 3),
+    }
+
+# Runs in a fresh interpreter so nothing bench.py imports is already loaded
+STARTUP_PROBE = r"""
+import sys, json, time
+start = time.perf_counter()
+import api
+imported = time.perf_counter()
+print("ready", flush=True)
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(l.split()[1]) for l in f if l.startswith("VmRSS")) / 1024
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+ready_rss = rss_mb()
+modules = len(sys.modules)
+import asyncio, httpx, stub_upstream
+stub_upstream.install()
+
+async def serve():
+    transport = httpx.ASGITransport(app=api.app)
+    async with api.lifespan(api.app), httpx.AsyncClient(transport=transport, base_url="http://probe") as client:
+        for path in sys.argv[1:]:
+            (await client.get(path)).raise_for_status()
+
+asyncio.run(serve())
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "ready_rss_mb": ready_rss,
+    "serving_rss_mb": rss_mb(),
+    "modules": modules,
+    "bs4_loaded": "bs4" in sys.modules,
+}))
+"""
+
+STARTUP_PROFILES = {"full": {}, "api-only": {"MOVIEBOX_API_ONLY": "1"}}
+# Endpoints both profiles serve, so RSS after serving is comparable
+STARTUP_PATHS = ["/home", "/search?q=avatar", "/search/suggest?q=avatar", "/api/stream/1?detail_path=bench-slug"]
+
+def startup_report(runs: int) -> dict:
+    report = {}
+    for profile, env in STARTUP_PROFILES.items():
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            proc = subprocess.Popen(
+                [sys.executable, "-c", STARTUP_PROBE, *STARTUP_PATHS],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                env={**os.environ, "MOVIEBOX_API_ONLY": "", "MOVIEBOX_CACHE": "", **env},
+                stdout=subprocess.PIPE, text=True,
+            )
+            proc.stdout.readline()
+            ready_ms = (time.perf_counter() - start) * 1000
+            out, _ = proc.communicate()
+            if proc.returncode:
+                raise RuntimeError(f"startup probe for {profile} exited with {proc.returncode}")
+            samples.append({"process_ready_ms": ready_ms, **json.loads(out.strip().splitlines()[-1])})
+        report[profile] = {
+            key: round(statistics.median(s[key] for s in samples), 1) if key != "bs4_loaded" else samples[0][key]
+            for key in samples[0]
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline parser benchmarks against recorded fixtures")
+    parser.add_argument("-k", "--filter", default="", help="only run cases containing this substring")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per sample")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown before failing (0.25 = 25%%)")
+    parser.add_argument("--save", action="store_true", help=f"write results to {os.path.basename(BASELINE_PATH)}")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--memory", action="store_true", help="compare retained memory of dict vs record cards")
+    parser.add_argument("--copies", type=int, default=5, help="catalog copies held during --memory")
+    parser.add_argument("--startup", action="store_true",
+                        help="compare cold-start time and per-worker RSS of the full and API-only profiles (--repeat runs each)")
+    args = parser.parse_args()
+
+    if args.memory:
+        print(json.dumps(memory_report(args.copies), indent=2))
+        return
+    if args.startup:
+        print(json.dumps(startup_report(args.repeat), indent=2))
+        return
+
+    cases = {k: v for k, v in build_cases().items() if args.filter in k}
+    results = {name: measure(func, args.min_time, args.repeat) for name, func in cases.items()}
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH) and not args.save:
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.json:
+        print(json.dumps({"results": results, "regressions": regressions}, indent=2))
+    else:
+        for name, r in results.items():
+            vs = f"  {r['vs_baseline']:.2f}x" if "vs_baseline" in r else ""
+            print(f"{name:32s} {r['median_ms']:10.3f} ms  (min {r['min_ms']:.3f}, {r['loops']} loops){vs}")
+        for line in regressions:
+            print(f"[REGRESSION] {line}")
+
+    if args.save:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+            f.write("\n")
+        print(f"\nbaseline saved to {BASELINE_PATH}")
+
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import os
+import asyncio
+
+from fastapi import APIRouter, HTTPException
+
+import feed
+import metrics
+from rendering import TimedJSONResponse
+
+# Upper bound for a whole /bundle request; ?timeout= can only shorten it
+DEADLINE = float(os.environ.get("MOVIEBOX_BUNDLE_DEADLINE", "10"))
+
+# name -> coroutine function returning the same payload as the standalone endpoint.
+# api.py adds scraper.BUNDLE_PARTS unless MOVIEBOX_API_ONLY=1.
+PARTS = {"home": feed.home_payload}
+
+router = APIRouter()
+
+async def _run(name: str, timeout: float):
+    try:
+        result = await asyncio.wait_for(PARTS[name](), timeout)
+    except asyncio.TimeoutError:
+        metrics.BUNDLE_PARTS.inc(part=name, result="timeout")
+        return None, {"status": 504, "detail": f"Timed out after {timeout:g}s"}
+    except HTTPException as e:
+        metrics.BUNDLE_PARTS.inc(part=name, result="error")
+        return None, {"status": e.status_code, "detail": e.detail}
+    except Exception as e:
+        print(f"Warning: bundle part {name!r} failed: {e!r}")
+        metrics.BUNDLE_PARTS.inc(part=name, result="error")
+        return None, {"status": 500, "detail": "Internal Server Error"}
+    metrics.BUNDLE_PARTS.inc(part=name, result="ok")
+    return result, None
+
+@router.get("/bundle")
+async def get_bundle(include: str = None, timeout: float = None):
+    names = list(dict.fromkeys(n.strip() for n in include.split(",") if n.strip())) if include else list(PARTS)
+    unknown = [n for n in names if n not in PARTS]
+    if unknown or not names:
+        raise HTTPException(
+            status_code=400,
+            detail={"message": f"Unknown parts: {', '.join(unknown)}" if unknown else "No parts requested",
+                    "available": list(PARTS)}
+        )
+    timeout = min(timeout, DEADLINE) if timeout and timeout > 0 else DEADLINE
+
+    # Every part starts at once and shares one deadline; a part that fails or runs out
+    # of time is reported under "errors" without holding back the others
+    outcomes = await asyncio.gather(*(_run(name, timeout) for name in names))
+    parts = {name: result for name, (result, error) in zip(names, outcomes) if error is None}
+    errors = {name: error for name, (result, error) in zip(names, outcomes) if error is not None}
+    return TimedJSONResponse(
+        {"complete": not errors, "parts": parts, "errors": errors},
+        status_code=200 if parts else 502,
+    )
@@ -0,0 +1,432 @@
+import os
+import time
+import pickle
+import asyncio
+import sqlite3
+import inspect
+import secrets
+import tempfile
+import functools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import metrics
+import timing
+
+# Bump when the shape of cached values changes, so workers running a new release
+# never unpickle entries written by an old one
+KEY_PREFIX = "moviebox:v2:"
+
+def _ttls(spec: str) -> dict[str, float]:
+    ttls = {"home": 60, "tab": 300, "detail": 600, "stream": 120}
+    for part in filter(None, spec.split(",")):
+        kind, _, seconds = part.partition("=")
+        ttls[kind.strip()] = float(seconds)
+    return ttls
+
+# Seconds per cached kind, overridable with MOVIEBOX_CACHE_TTL=home=30,detail=900
+TTLS = _ttls(os.environ.get("MOVIEBOX_CACHE_TTL", ""))
+
+# A refresh holds the lock at most this long; other workers wait up to LOCK_WAIT for
+# its result before giving up and fetching upstream themselves
+LOCK_TTL = 30.0
+LOCK_WAIT = 10.0
+POLL_INTERVAL = 0.05
+# After a backend error, requests skip the cache for this long instead of each
+# paying for a failed connect
+SUSPEND_AFTER_ERROR = 5.0
+
+class CacheError(Exception):
+    pass
+
+# Entries that no longer unpickle (corrupt, or written by code that has since changed)
+# are treated as misses and deleted, so the next refresh replaces them
+def _unpickle(key: str, data: bytes):
+    try:
+        return pickle.loads(data), True
+    except Exception as e:
+        print(f"Warning: dropping unreadable cache entry {key!r}: {e!r}")
+        return None, False
+
+class CacheBackend:
+    name = "none"
+
+    async def get(self, key: str):
+        raise NotImplementedError
+
+    async def set(self, key: str, value, ttl: float):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    # Returns a token if the lock was taken, None if someone else holds it
+    async def acquire(self, key: str, ttl: float):
+        raise NotImplementedError
+
+    async def release(self, key: str, token: str):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+# ---- In-process LRU ----
+
+class MemoryCache(CacheBackend):
+    name = "memory"
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._locks: dict[str, tuple[float, str]] = {}
+
+    async def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    async def acquire(self, key: str, ttl: float):
+        now = time.monotonic()
+        held = self._locks.get(key)
+        if held is not None and held[0] > now:
+            return None
+        token = secrets.token_hex(8)
+        self._locks[key] = (now + ttl, token)
+        return token
+
+    async def release(self, key: str, token: str):
+        held = self._locks.get(key)
+        if held is not None and held[1] == token:
+            del self._locks[key]
+
+# ---- SQLite, shared by the workers on one host ----
+
+class SQLiteCache(CacheBackend):
+    name = "sqlite"
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._conn = None
+        self._writes = 0
+        # sqlite3 calls block (busy_timeout waits on other workers' writes), so they run on
+        # one dedicated thread that also owns the connection
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-cache")
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS locks (key TEXT PRIMARY KEY, token TEXT NOT NULL, expires REAL NOT NULL)")
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, func, *args)
+        except sqlite3.Error as e:
+            raise CacheError(f"sqlite cache: {e}") from e
+
+    def _get(self, key: str):
+        conn = self._connect()
+        row = conn.execute("SELECT value FROM cache WHERE key = ? AND expires > ?", (key, time.time())).fetchone()
+        if row is None:
+            return None
+        value, ok = _unpickle(key, row[0])
+        if not ok:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+        return value
+
+    def _set(self, key: str, data: bytes, ttl: float):
+        conn = self._connect()
+        now = time.time()
+        conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", (key, data, now + ttl))
+        self._writes += 1
+        if self._writes % 100 == 0:
+            conn.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+            conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def _acquire(self, key: str, token: str, ttl: float) -> bool:
+        now = time.time()
+        # One statement, so taking a free or expired lock is atomic across processes
+        cur = self._connect().execute(
+            "INSERT INTO locks VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE "
+            "SET token = excluded.token, expires = excluded.expires WHERE locks.expires <= ?",
+            (key, token, now + ttl, now),
+        )
+        return cur.rowcount == 1
+
+    async def get(self, key: str):
+        return await self._run(self._get, key)
+
+    async def set(self, key: str, value, ttl: float):
+        await self._run(self._set, key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ttl)
+
+    async def delete(self, key: str):
+        await self._run(lambda: self._connect().execute("DELETE FROM cache WHERE key = ?", (key,)))
+
+    async def acquire(self, key: str, ttl: float):
+        token = secrets.token_hex(8)
+        return token if await self._run(self._acquire, key, token, ttl) else None
+
+    async def release(self, key: str, token: str):
+        await self._run(lambda: self._connect().execute("DELETE FROM locks WHERE key = ? AND token = ?", (key, token)))
+
+    async def close(self):
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+
+# ---- Redis protocol (RESP2) ----
+
+def _encode_command(*args) -> bytes:
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode("utf-8")
+        out.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(out)
+
+async def _read_reply(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise CacheError("redis connection closed")
+    prefix, rest = line[:1], line[1:-2]
+    if prefix == b"+":
+        return rest.decode("utf-8")
+    if prefix == b"-":
+        raise CacheError(f"redis: {rest.decode('utf-8', 'replace')}")
+    if prefix == b":":
+        return int(rest)
+    if prefix == b"$":
+        size = int(rest)
+        if size < 0:
+            return None
+        return (await reader.readexactly(size + 2))[:-2]
+    if prefix == b"*":
+        size = int(rest)
+        if size < 0:
+            return None
+        return [await _read_reply(reader) for _ in range(size)]
+    raise CacheError(f"redis: unexpected reply {line!r}")
+
+class RedisCache(CacheBackend):
+    name = "redis"
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, db: int = 0,
+                 password: str = None, max_connections: int = 8, timeout: float = 2.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._idle: list = []
+        self._slots = asyncio.Semaphore(max_connections)
+
+    async def _open(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            if self.password:
+                writer.write(_encode_command("AUTH", self.password))
+                await _read_reply(reader)
+            if self.db:
+                writer.write(_encode_command("SELECT", self.db))
+                await _read_reply(reader)
+        except BaseException:
+            # Rejected AUTH/SELECT, or the handshake timed out
+            writer.close()
+            raise
+        return reader, writer
+
+    async def execute(self, *args):
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else None
+            try:
+                if conn is None:
+                    conn = await asyncio.wait_for(self._open(), self.timeout)
+                reader, writer = conn
+                writer.write(_encode_command(*args))
+                reply = await asyncio.wait_for(_read_reply(reader), self.timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                # The connection may be mid-reply; never hand it out again
+                if conn is not None:
+                    conn[1].close()
+                raise CacheError(f"redis {self.host}:{self.port}: {e!r}") from e
+            except CacheError:
+                if conn is not None:
+                    conn[1].close()
+                raise
+            self._idle.append(conn)
+            return reply
+
+    async def get(self, key: str):
+        data = await self.execute("GET", key)
+        if data is None:
+            return None
+        value, ok = _unpickle(key, data)
+        if not ok:
+            await self.delete(key)
+        return value
+
+    async def set(self, key: str, value, ttl: float):
+        await self.execute("SET", key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), "PX", int(ttl * 1000))
+
+    async def delete(self, key: str):
+        await self.execute("DEL", key)
+
+    async def acquire(self, key: str, ttl: float):
+        token = secrets.token_hex(8)
+        reply = await self.execute("SET", f"{key}:lock", token, "NX", "PX", int(ttl * 1000))
+        return token if reply == "OK" else None
+
+    async def release(self, key: str, token: str):
+        # Not atomic, but the lock only expires after LOCK_TTL, far longer than this round trip
+        if await self.execute("GET", f"{key}:lock") == token.encode():
+            await self.execute("DEL", f"{key}:lock")
+
+    async def close(self):
+        while self._idle:
+            self._idle.pop()[1].close()
+
+# ---- Configuration ----
+
+def default_sqlite_path() -> str:
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, "moviebox-cache.sqlite")
+
+# MOVIEBOX_CACHE: memory, sqlite:///path, or redis://[:password@]host:port/db; unset disables caching
+def from_url(url: str):
+    if not url or url == "none":
+        return None
+    parts = urlsplit(url if "://" in url else url + "://")
+    options = {k: v[0] for k, v in parse_qs(parts.query).items()}
+    if parts.scheme == "memory":
+        return MemoryCache(int(options.get("max_entries", 1024)))
+    if parts.scheme == "sqlite":
+        return SQLiteCache(unquote(parts.path) or default_sqlite_path(), int(options.get("max_entries", 10000)))
+    if parts.scheme == "redis":
+        return RedisCache(
+            parts.hostname or "127.0.0.1",
+            parts.port or 6379,
+            int(parts.path.strip("/") or 0),
+            unquote(parts.password) if parts.password else None,
+            int(options.get("max_connections", 8)),
+        )
+    raise ValueError(f"Unsupported MOVIEBOX_CACHE backend {url!r}")
+
+# Replaced by loadtest.py --cache
+BACKEND: CacheBackend = from_url(os.environ.get("MOVIEBOX_CACHE", ""))
+
+# ---- Read-through caching ----
+
+_suspended_until = 0.0
+
+def _suspend(e: CacheError):
+    global _suspended_until
+    if time.monotonic() >= _suspended_until:
+        print(f"Warning: cache backend failed, bypassing it for {SUSPEND_AFTER_ERROR:g}s: {e}")
+    _suspended_until = time.monotonic() + SUSPEND_AFTER_ERROR
+
+async def _lookup(backend: CacheBackend, kind: str, key: str):
+    try:
+        with timing.stage("cache"):
+            return await backend.get(key)
+    except CacheError as e:
+        _suspend(e)
+        metrics.CACHE_REQUESTS.inc(cache=kind, result="error")
+        return None
+
+async def _refresh(backend: CacheBackend, kind: str, key: str, build):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + LOCK_WAIT
+    try:
+        token = await backend.acquire(key, LOCK_TTL)
+        # Another worker is refreshing this key; wait for its result instead of
+        # sending the same upstream requests again, or take over if it gave up
+        while token is None:
+            if loop.time() >= deadline:
+                return await build()
+            await asyncio.sleep(POLL_INTERVAL)
+            value = await _lookup(backend, kind, key)
+            if value is not None:
+                metrics.CACHE_REQUESTS.inc(cache=kind, result="shared")
+                return value
+            token = await backend.acquire(key, LOCK_TTL)
+    except CacheError as e:
+        _suspend(e)
+        return await build()
+    try:
+        # The previous holder may have stored a value between our miss and the acquire
+        value = await _lookup(backend, kind, key)
+        if value is not None:
+            return value
+        value = await build()
+        try:
+            await backend.set(key, value, TTLS[kind])
+        except CacheError as e:
+            _suspend(e)
+        return value
+    finally:
+        try:
+            await backend.release(key, token)
+        except CacheError:
+            pass
+
+# Concurrent misses in one worker share a single refresh
+_inflight: dict[str, asyncio.Future] = {}
+
+# Caches the coroutine's result for TTLS[kind], keyed by its arguments. Exceptions
+# (e.g. HTTPException for a missing title) are never cached.
+def cached(kind: str):
+    def decorate(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            backend = BACKEND
+            if backend is None or time.monotonic() < _suspended_until:
+                return await func(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            # repr, not ":".join: ("1:x", "y") and ("1", "x:y") must not share a key
+            key = KEY_PREFIX + kind + ":" + repr(tuple(bound.arguments.values()))
+
+            value = await _lookup(backend, kind, key)
+            if value is not None:
+                metrics.CACHE_REQUESTS.inc(cache=kind, result="hit")
+                return value
+            future = _inflight.get(key)
+            if future is None:
+                metrics.CACHE_REQUESTS.inc(cache=kind, result="miss")
+                future = _inflight[key] = asyncio.ensure_future(
+                    _refresh(backend, kind, key, lambda: func(*args, **kwargs))
+                )
+                future.add_done_callback(lambda _: _inflight.pop(key, None))
+            else:
+                metrics.CACHE_REQUESTS.inc(cache=kind, result="shared")
+            return await asyncio.shield(future)
+        return wrapper
+    return decorate
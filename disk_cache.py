@@ -0,0 +1,79 @@
+import os
+import hashlib
+import tempfile
+
+import metrics
+
+# Size-bounded LRU of files in one directory, safe to share between workers.
+# Entries are written to a temp file and renamed into place so readers never see
+# partial files; recency is the file mtime, bumped on every hit.
+class DiskCache:
+    def __init__(self, name: str, directory: str, max_bytes: int):
+        self.name = name
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def key(*parts) -> str:
+        return hashlib.sha256("\0".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str):
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            metrics.CACHE_REQUESTS.inc(cache=self.name, result="miss")
+            return None
+        metrics.CACHE_REQUESTS.inc(cache=self.name, result="hit")
+        return path
+
+    def temp_file(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        return os.fdopen(fd, "wb"), tmp_path
+
+    def commit(self, tmp_path: str, key: str) -> str:
+        path = self.path(key)
+        size = os.path.getsize(tmp_path)
+        if size > self.max_bytes:
+            os.unlink(tmp_path)
+            return None
+        os.replace(tmp_path, path)
+        self._size += size
+        if self._size > self.max_bytes:
+            self._evict()
+        return path
+
+    def put(self, key: str, data: bytes) -> str:
+        f, tmp_path = self.temp_file()
+        with f:
+            f.write(data)
+        return self.commit(tmp_path, key)
+
+    def _entries(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".part"):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.path, st.st_size, st.st_mtime
+
+    def _evict(self):
+        # Rescan rather than trust the running total: other workers share the directory
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._size = total
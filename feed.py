@@ -0,0 +1,321 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+import cache
+import metrics
+import timing
+import upstream
+import home_feed
+import stream_proxy
+from upstream import BASE_URL
+from rendering import TimedJSONResponse, render_json
+from records import FeedSection, FeedCard, BannerCard
+
+# JSON proxy routes backed by the h5-api BFF and player hosts; these never need bs4
+router = APIRouter()
+
+@cache.cached("home")
+async def _home_data() -> dict:
+    url = "https://h5-api.aoneroom.com/wefeed-h5api-bff/home?host=moviebox.ph"
+    headers = {"User-Agent": "Mozilla/5.0"}
+    async with upstream.session() as client:
+        resp = await client.get(url, headers=headers, timeout=30)
+    
+    if resp.status_code != 200:
+        raise HTTPException(status_code=500, detail="Failed to fetch backend API")
+        
+    with timing.stage("decode"):
+        data = resp.json().get("data", {})
+    ops = data.get("operatingList", [])
+    
+    sections = []
+    map_size = 0 
+    
+    with timing.stage("extract"):
+        for op in ops:
+            title = op.get("title", "")
+        
+            if op.get("banner"):
+                banner_items = []
+                for item in op["banner"].get("items", []):
+                    name = item.get("title")
+                    if "Communities" in name or not name: continue
+                
+                    poster = item.get("image", {}).get("url")
+                    if not poster and item.get("subject"):
+                        poster = item["subject"].get("cover", {}).get("url")
+                
+                    detail_path = item.get("detailPath")
+                    badge = None
+                    if item.get("subject"):
+                        badge = item["subject"].get("corner") 
+                
+                    banner_items.append(BannerCard(
+                        name=name,
+                        poster_url=poster,
+                        url=BASE_URL + f"/detail/{detail_path}" if detail_path else None,
+                        badge=badge,
+                        slug=detail_path
+                    ))
+                sections.append(FeedSection("Banner", banner_items))
+                continue
+
+            subs = op.get("subjects", [])
+            if not subs or not title: continue
+        
+            movies = []
+            for sub in subs:
+                name = sub.get("title") or sub.get("name")
+                poster = sub.get("cover", {}).get("url") or sub.get("thumbnail")
+                detail_path = sub.get("detailPath")
+            
+                movies.append(FeedCard(
+                    name=name,
+                    poster_url=poster,
+                    url=BASE_URL + f"/detail/{detail_path}" if detail_path else None,
+                    slug=detail_path,
+                    badge=sub.get("corner"),
+                    blurhash=sub.get("cover", {}).get("blurHash")
+                ))
+            
+            sections.append(FeedSection(title, movies))
+    metrics.record_empty_sections(sections, upstream.route_label())
+    return {
+        "version": await home_feed.stamp(sections, resp.content),
+        "source": url,
+        "total_sections": len(sections),
+        "poster_map_size": map_size,
+        "sections": sections,
+    }
+
+CHANNEL = home_feed.Channel(_home_data)
+
+async def home_payload() -> dict:
+    home_data = await _home_data()
+    CHANNEL.observe(home_data)
+    return home_data
+
+@router.get("/home")
+async def get_home(since: int = None):
+    home_data = await home_payload()
+    if since is None:
+        return TimedJSONResponse(home_data)
+    return TimedJSONResponse(await home_feed.changes(since, home_data))
+
+@router.get("/home/events")
+async def get_home_events(request: Request, since: int = None):
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        since = int(last_event_id)
+    scope = request.scope
+    return StreamingResponse(
+        CHANNEL.events(since, lambda content: render_json(content, scope)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/home/sections")
+async def get_section_names():
+    home_data = await _home_data()
+    sections = home_data["sections"]
+    return TimedJSONResponse({
+        "total": len(sections),
+        "sections": [
+            {"name": s["section"], "count": s["count"], "more_url": s["more_url"]}
+            for s in sections
+        ]
+    })
+
+@router.get("/home/banner")
+async def get_banner():
+    home_data = await _home_data()
+    for s in home_data["sections"]:
+        if s["section"] == "Banner":
+            return TimedJSONResponse({"count": s["count"], "featured": s["movies"]})
+    return TimedJSONResponse({"count": 0, "featured": []})
+
+@router.get("/home/trending")
+async def get_trending():
+    home_data = await _home_data()
+    for s in home_data["sections"]:
+        if "trending now" in s["section"].lower():
+            return TimedJSONResponse(s)
+    raise HTTPException(status_code=404, detail="Trending Now section not found")
+
+@router.get("/home/hot")
+async def get_hot():
+    home_data = await _home_data()
+    for s in home_data["sections"]:
+        if "hot" in s["section"].lower():
+            return TimedJSONResponse(s)
+    raise HTTPException(status_code=404, detail="Hot section not found")
+
+@router.get("/home/cinema")
+async def get_cinema():
+    home_data = await _home_data()
+    for s in home_data["sections"]:
+        if "cinema" in s["section"].lower():
+            return TimedJSONResponse(s)
+    raise HTTPException(status_code=404, detail="Cinema section not found")
+
+@router.get("/home/section/{name}")
+async def get_section_by_name(name: str):
+    home_data = await _home_data()
+    sections = home_data["sections"]
+    matched = [s for s in sections if name.lower() in s["section"].lower()]
+    if not matched:
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "message": f"No section matching '{name}'",
+                "available": [s["section"] for s in sections]
+            }
+        )
+    return TimedJSONResponse({"results": matched})
+
+@router.get("/search/suggest")
+async def get_search_suggestions(q: str):
+    url = "https://h5-api.aoneroom.com/wefeed-h5api-bff/subject/search-suggest"
+    payload = {"keyword": q, "perPage": 10}
+    headers = {
+        "User-Agent": "Mozilla/5.0",
+        "Content-Type": "application/json"
+    }
+    async with upstream.session() as client:
+        resp = await client.post(url, json=payload, headers=headers, timeout=10)
+        
+    if resp.status_code != 200:
+        raise HTTPException(status_code=500, detail="Search API failed")
+        
+    with timing.stage("decode"):
+        data = resp.json()
+    items = data.get("data", {}).get("items", [])
+    suggestions = [item.get("word") for item in items if item.get("word")]
+    return TimedJSONResponse({"query": q, "suggestions": suggestions})
+
+@router.get("/search")
+async def get_search_results(q: str):
+    url = "https://h5-api.aoneroom.com/wefeed-h5api-bff/subject/search"
+    payload = {"keyword": q, "perPage": 30, "page": 1}
+    headers = {
+        "User-Agent": "Mozilla/5.0",
+        "Content-Type": "application/json"
+    }
+    async with upstream.session() as client:
+        resp = await client.post(url, json=payload, headers=headers, timeout=15)
+        
+    if resp.status_code != 200:
+        raise HTTPException(status_code=500, detail="Search API failed")
+        
+    with timing.stage("decode"):
+        data = resp.json()
+    items = data.get("data", {}).get("items", [])
+    
+    with timing.stage("extract"):
+        movies = []
+        for sub in items:
+            name = sub.get("title")
+            poster = sub.get("cover", {}).get("url")
+            detail_path = sub.get("detailPath")
+        
+            movies.append(FeedCard(
+                name=name,
+                poster_url=poster,
+                url=BASE_URL + f"/detail/{detail_path}" if detail_path else None,
+                slug=detail_path,
+                badge=sub.get("corner"),
+                blurhash=sub.get("cover", {}).get("blurHash")
+            ))
+        
+    return TimedJSONResponse({
+        "query": q,
+        "count": len(movies),
+        "movies": movies
+    })
+
+@cache.cached("stream")
+async def _stream_data(subject_id: str, detail_path: str, se: int = 0, ep: int = 0):
+    domain_url = "https://h5-api.aoneroom.com/wefeed-h5api-bff/media-player/get-domain"
+    domain = "https://123movienow.cc" 
+    
+    headers = {
+        "User-Agent": "Mozilla/5.0",
+        "X-Client-Info": '{"timezone":"Asia/Dhaka"}',
+        "X-Client-Type": "h5",
+        "X-App-Version": "1.0.0"
+    }
+
+    async with upstream.session() as client:
+        try:
+            r_dom = await client.get(domain_url, headers=headers, timeout=5)
+            if r_dom.status_code == 200:
+                with timing.stage("decode"):
+                    dom_data = r_dom.json()
+                domain = dom_data.get("data", domain)
+                if domain.endswith("/"):
+                    domain = domain[:-1]
+        except Exception as e:
+            print(f"Warning: Failed to fetch player domain, using fallback: {e}")
+            pass
+            
+        play_url = f"{domain}/wefeed-h5api-bff/subject/play?subjectId={subject_id}&se={se}&ep={ep}&detailPath={detail_path}"
+        
+        play_headers = {
+            'accept': 'application/json',
+            'accept-language': 'en-US,en;q=0.9',
+            'referer': f'{domain}/spa/videoPlayPage/movies/{detail_path}?id={subject_id}&type=/movie/detail&detailSe=&detailEp=&lang=en',
+            'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/145.0.0.0 Safari/537.36',
+            'x-client-info': '{"timezone":"Asia/Dhaka"}',
+            'x-source': ''
+        }
+        
+        cookies = {
+            "uuid": "d8c3539e-2e46-4000-af20-7046a856e30a" 
+        }
+
+        resp = await client.get(play_url, headers=play_headers, cookies=cookies, timeout=15)
+        
+        if resp.status_code != 200:
+            raise HTTPException(status_code=500, detail=f"Player API returned {resp.status_code}")
+            
+        with timing.stage("decode"):
+            data = resp.json()
+        streams = data.get("data", {}).get("streams", [])
+        
+        if not streams:
+            raise HTTPException(status_code=404, detail="No streams found or hasResource is False.")
+            
+        with timing.stage("extract"):
+            formatted_streams = []
+            for s in streams:
+                formatted_streams.append({
+                    "resolution": s.get("resolutions") + "p" if s.get("resolutions") else "Unknown",
+                    "format": s.get("format"),
+                    "url": s.get("url"),
+                    "size_bytes": s.get("size"),
+                    "id": s.get("id")
+                })
+                if stream_proxy.ENABLED and s.get("url"):
+                    formatted_streams[-1]["proxy_url"] = stream_proxy.proxy_url(s["url"])
+            
+            try:
+                formatted_streams.sort(key=lambda x: int(x["resolution"].replace("p", "")), reverse=True)
+            except:
+                 pass
+
+        return {
+            "subject_id": subject_id,
+            "detail_path": detail_path,
+            "season": se,
+            "episode": ep,
+            "stream_domain": domain,
+            "count": len(formatted_streams),
+            "sources": formatted_streams,
+            "raw": data.get("data", {})
+        }
+
+# Returned as a response so FastAPI's jsonable_encoder pass is skipped and the whole
+# serialization is timed
+@router.get("/api/stream/{subject_id}")
+async def get_stream_sources(subject_id: str, detail_path: str, se: int = 0, ep: int = 0):
+    return TimedJSONResponse(await _stream_data(subject_id, detail_path, se, ep))
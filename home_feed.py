@@ -0,0 +1,223 @@
+import os
+import time
+import asyncio
+import hashlib
+
+import cache
+import metrics
+from records import dumps
+
+# Every distinct home snapshot gets a version: the wall clock in milliseconds when the
+# content was first built, so versions keep increasing across restarts and deploys
+HISTORY_TTL = float(os.environ.get("MOVIEBOX_HOME_HISTORY_TTL", "3600"))
+POLL_INTERVAL = float(os.environ.get("MOVIEBOX_HOME_POLL", "15"))
+HEARTBEAT = 15.0
+
+SNAPSHOT_KEY = cache.KEY_PREFIX + "home-snapshot:"
+LATEST_KEY = SNAPSHOT_KEY + "latest"
+
+# Snapshot indices seen by this worker; with a shared cache backend they are also
+# stored there, so every worker agrees on versions and can diff from any of them
+_local = cache.MemoryCache(32)
+
+def _unique(keys: list[str]) -> list[str]:
+    seen: dict[str, int] = {}
+    out = []
+    for key in keys:
+        seen[key] = seen.get(key, 0) + 1
+        out.append(key if seen[key] == 1 else f"{key}#{seen[key]}")
+    return out
+
+def card_key(card) -> str:
+    return card.slug or card.url or card.name or ""
+
+def section_keys(sections) -> list[str]:
+    return _unique([s.section for s in sections])
+
+def build_index(sections) -> dict:
+    index = {"order": section_keys(sections), "sections": {}}
+    digest = hashlib.blake2b(digest_size=16)
+    for key, section in zip(index["order"], sections):
+        cards = []
+        for ckey, card in zip(_unique([card_key(c) for c in section.movies]), section.movies):
+            cards.append((ckey, hashlib.blake2b(dumps(card), digest_size=8).digest()))
+        entry = {"more_url": section.more_url, "cards": cards}
+        index["sections"][key] = entry
+        digest.update(repr((key, entry)).encode())
+    index["digest"] = digest.hexdigest()
+    return index
+
+async def _load(key: str):
+    value = await _local.get(key)
+    if value is None and cache.BACKEND is not None:
+        try:
+            value = await cache.BACKEND.get(key)
+        except cache.CacheError:
+            return None
+        if value is not None:
+            await _local.set(key, value, HISTORY_TTL)
+    return value
+
+async def _latest():
+    if cache.BACKEND is not None:
+        try:
+            return await cache.BACKEND.get(LATEST_KEY)
+        except cache.CacheError:
+            pass
+    return await _local.get(LATEST_KEY)
+
+async def _store(key: str, value):
+    await _local.set(key, value, HISTORY_TTL)
+    if cache.BACKEND is not None:
+        try:
+            await cache.BACKEND.set(key, value, HISTORY_TTL)
+        except cache.CacheError:
+            pass
+
+async def _publish(index: dict) -> int:
+    await _store(SNAPSHOT_KEY + str(index["version"]), index)
+    await _store(LATEST_KEY, index)
+    return index["version"]
+
+# Called by the home builder, which the response cache runs once per refresh across
+# workers. An identical upstream body skips the per-card index; content that only
+# differs in fields we drop keeps its version too. Either way the latest snapshot is
+# stored again, so unchanged content keeps its version past HISTORY_TTL.
+async def stamp(sections, body: bytes) -> int:
+    source = hashlib.blake2b(body, digest_size=16).hexdigest()
+    latest = await _latest()
+    if latest is not None and latest["source"] == source:
+        return await _publish(latest)
+    index = build_index(sections)
+    index["source"] = source
+    if latest is not None and latest["digest"] == index["digest"]:
+        return await _publish(dict(latest, source=source))
+    index["version"] = max(int(time.time() * 1000), latest["version"] + 1 if latest else 0)
+    return await _publish(index)
+
+def diff(old: dict, new: dict, sections) -> dict:
+    by_key = dict(zip(new["order"], sections))
+    added, changed = {}, {}
+    for key in new["order"]:
+        entry, before = new["sections"][key], old["sections"].get(key)
+        if before is None:
+            added[key] = by_key[key]
+            continue
+        if before == entry:
+            continue
+        section = by_key[key]
+        old_cards = dict(before["cards"])
+        new_keys = [ckey for ckey, _ in entry["cards"]]
+        kept = set(new_keys)
+        change = {
+            "count": section.count,
+            "more_url": section.more_url,
+            "cards": {
+                ckey: card for (ckey, digest), card in zip(entry["cards"], section.movies)
+                if old_cards.get(ckey) != digest
+            },
+            "removed": [ckey for ckey in old_cards if ckey not in kept],
+        }
+        if [ckey for ckey, _ in before["cards"]] != new_keys:
+            change["order"] = new_keys
+        changed[key] = change
+    delta = {}
+    if old["order"] != new["order"]:
+        delta["order"] = new["order"]
+    delta["added"] = added
+    delta["removed"] = [key for key in old["order"] if key not in new["sections"]]
+    delta["changed"] = changed
+    return delta
+
+# Deltas are shared by every poller and subscriber asking for the same pair of versions
+_deltas: dict[tuple, dict] = {}
+
+def _full(data: dict, since: int = None) -> dict:
+    result = {"version": data["version"]}
+    if since is not None:
+        result["since"] = since
+    result["full"] = True
+    result.update((k, v) for k, v in data.items() if k != "version")
+    return result
+
+async def changes(since: int, data: dict, channel: str = "poll") -> dict:
+    version = data["version"]
+    result = _deltas.get((since, version))
+    if result is None:
+        if since is None:
+            result = _full(data)
+        elif since == version:
+            result = {"version": version, "since": since, "full": False, "added": {}, "removed": [], "changed": {}}
+        else:
+            old = await _load(SNAPSHOT_KEY + str(since))
+            if old is None:
+                # Expired, or handed out by a worker that does not share our cache backend
+                result = _full(data, since)
+            else:
+                new = await _load(SNAPSHOT_KEY + str(version)) or build_index(data["sections"])
+                result = {"version": version, "since": since, "full": False, **diff(old, new, data["sections"])}
+        if len(_deltas) >= 64:
+            _deltas.clear()
+        _deltas[(since, version)] = result
+    kind = "full" if result["full"] else "unchanged" if since == version else "delta"
+    metrics.HOME_FEED_RESPONSES.inc(channel=channel, kind=kind)
+    return result
+
+def _event(name: str, version: int, payload: bytes) -> bytes:
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (version, name.encode(), payload)
+
+# Pushes deltas to server-sent event subscribers. While anyone is subscribed the worker
+# re-reads the home feed every POLL_INTERVAL seconds; /home requests that see a newer
+# version wake the subscribers too.
+class Channel:
+    def __init__(self, load):
+        self.load = load
+        self.data = None
+        self.subscribers = 0
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def observe(self, data: dict):
+        if self.data is None or data["version"] > self.data["version"]:
+            self.data = data
+            self._changed.set()
+            self._changed = asyncio.Event()
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(POLL_INTERVAL)
+            if not self.subscribers:
+                break
+            try:
+                self.observe(await self.load())
+            except Exception as e:
+                print(f"Warning: home feed refresh failed: {e!r}")
+        self.task = None
+
+    async def events(self, since: int, render):
+        self.subscribers += 1
+        metrics.HOME_FEED_SUBSCRIBERS.inc()
+        if self.task is None:
+            self.task = asyncio.create_task(self._poll())
+        try:
+            self.observe(await self.load())
+            first = True
+            while True:
+                data, changed = self.data, self._changed
+                if first or data["version"] != since:
+                    result = await changes(since, data, channel="push")
+                    yield _event("snapshot" if result["full"] else "delta", data["version"], render(result))
+                    since, first = data["version"], False
+                    continue
+                try:
+                    await asyncio.wait_for(changed.wait(), HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+        finally:
+            self.subscribers -= 1
+            metrics.HOME_FEED_SUBSCRIBERS.dec()
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
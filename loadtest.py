@@ -0,0 +1,357 @@
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import subprocess
+
+import httpx
+
+import cache
+import stub_upstream
+
+DETAIL_SLUG = "tokyo-ghoul-hindi-OlanoKZKGR2"
+
+ENDPOINTS = {
+    "home": "/home",
+    "movies": "/movies",
+    "detail": f"/detail/{DETAIL_SLUG}",
+    "suggest": "/search/suggest?q=avatar",
+    "stream": f"/api/stream/8906247916759695608?detail_path={DETAIL_SLUG}",
+    "bundle": "/bundle?include=home,movies,tv-series,animation,ranking",
+}
+
+DEFAULT_MIX = "home=3,movies=1,detail=2,suggest=4,stream=2"
+
+def parse_mix(spec: str) -> dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise SystemExit(f"unknown endpoint {name!r} in --mix (choose from {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    values = sorted(latencies)
+    return {
+        "requests": len(values) + errors,
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+    }
+
+# Samples how late the event loop wakes from short sleeps, and the CPU time the process
+# used, in the process serving the app
+class LagProbe:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.task = None
+        self.reset()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def reset(self):
+        self.samples: list = []
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+
+    def report(self) -> dict:
+        lag = sorted(self.samples)
+        wall = time.perf_counter() - self.started
+        return {
+            "event_loop_lag_ms": {
+                "p50": round(percentile(lag, 50) * 1000, 2),
+                "p99": round(percentile(lag, 99) * 1000, 2),
+                "max": round(lag[-1] * 1000, 2) if lag else 0.0,
+            },
+            "server_cpu_percent": round((time.process_time() - self.cpu_started) / wall * 100, 1) if wall else 0.0,
+        }
+
+# Runs the app on this event loop through httpx's ASGI transport (--in-process)
+class InProcessClient:
+    def __init__(self, client: httpx.AsyncClient, probe: LagProbe):
+        self.client = client
+        self.lag = probe
+
+    async def get(self, path: str, timeout: float) -> int:
+        return (await self.client.get(path, timeout=timeout)).status_code
+
+    async def reset_probe(self):
+        self.lag.reset()
+
+    async def probe(self) -> dict:
+        return self.lag.report()
+
+# Keep-alive HTTP/1.1 client for a worker started with --serve. httpx's connection pool
+# scans every connection for each queued request, so with a few hundred requests in
+# flight the load generator itself became the bottleneck.
+class SocketClient:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._idle: list = []
+
+    async def request(self, method: str, path: str, timeout: float) -> tuple[int, bytes]:
+        conn = self._idle.pop() if self._idle else await asyncio.open_connection(self.host, self.port)
+        reader, writer = conn
+        try:
+            writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\nContent-Length: 0\r\n\r\n".encode())
+            status, body, keep_alive = await asyncio.wait_for(_read_response(reader), timeout)
+        except BaseException:
+            # A timed-out connection may still receive the old response; never reuse it
+            writer.close()
+            raise
+        if keep_alive:
+            self._idle.append(conn)
+        else:
+            writer.close()
+        return status, body
+
+    async def get(self, path: str, timeout: float) -> int:
+        return (await self.request("GET", path, timeout))[0]
+
+    async def reset_probe(self):
+        await self.request("POST", PROBE_PATH, 10)
+
+    async def probe(self) -> dict:
+        status, body = await self.request("GET", PROBE_PATH, 10)
+        if status != 200:
+            raise RuntimeError(f"worker probe returned {status}")
+        return json.loads(body)
+
+    def close(self):
+        while self._idle:
+            self._idle.pop()[1].close()
+
+async def _read_response(reader: asyncio.StreamReader) -> tuple[int, bytes, bool]:
+    status = int((await reader.readline()).split(None, 2)[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if not size:
+                while (await reader.readline()) not in (b"\r\n", b""):
+                    pass
+                break
+            chunks.append((await reader.readexactly(size + 2))[:-2])
+        body = b"".join(chunks)
+    else:
+        return status, await reader.read(), False
+    return status, body, headers.get("connection", "").lower() != "close"
+
+async def run_rate(client, rate: float, duration: float, mix: dict, timeout: float, seed: int) -> dict:
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    loop = asyncio.get_running_loop()
+
+    async def fire(name: str, scheduled: float):
+        try:
+            ok = await client.get(ENDPOINTS[name], timeout) < 400
+        except Exception:
+            ok = False
+        # Measured from the scheduled send time, so queueing delay counts
+        if ok:
+            latencies[name].append(loop.time() - scheduled)
+        else:
+            errors[name] += 1
+
+    await client.reset_probe()
+    tasks = []
+    start = loop.time()
+    next_at = start
+    end = start + duration
+    # Open-loop Poisson arrivals: send times never wait for earlier responses
+    while True:
+        next_at += rng.expovariate(rate)
+        if next_at >= end:
+            break
+        delay = next_at - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        name = rng.choices(names, weights)[0]
+        tasks.append(asyncio.create_task(fire(name, next_at)))
+    await asyncio.gather(*tasks)
+    elapsed = loop.time() - start
+    server = await client.probe()
+
+    all_latencies = [v for values in latencies.values() for v in values]
+    return {
+        "offered_rps": rate,
+        "elapsed_s": round(elapsed, 3),
+        "total": summarize(all_latencies, sum(errors.values()), elapsed),
+        "endpoints": {name: summarize(latencies[name], errors[name], elapsed) for name in names},
+        **server,
+    }
+
+# ---- The worker under test ----
+
+PROBE_PATH = "/_loadtest/probe"
+
+def setup_app(args):
+    stub_upstream.install(args.latency / 1000, args.jitter / 1000)
+    if args.cache is not None:
+        cache.BACKEND = cache.from_url(args.cache)
+    import api
+    return api
+
+# --serve: one uvicorn worker on a local port, with the stand-in upstream and the probe
+def serve(args):
+    import uvicorn
+
+    api = setup_app(args)
+    probe = LagProbe(args.lag_interval)
+
+    async def read_probe():
+        return probe.report()
+
+    async def reset_probe():
+        probe.reset()
+
+    api.app.add_api_route(PROBE_PATH, read_probe, methods=["GET"], include_in_schema=False)
+    api.app.add_api_route(PROBE_PATH, reset_probe, methods=["POST"], include_in_schema=False)
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=args.port, log_level="warning"))
+
+    async def run():
+        probe.start()
+        await server.serve()
+    asyncio.run(run())
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_worker(args) -> tuple[subprocess.Popen, int]:
+    port = _free_port()
+    command = [
+        sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port),
+        "--latency", str(args.latency), "--jitter", str(args.jitter), "--lag-interval", str(args.lag_interval),
+    ]
+    if args.cache is not None:
+        command += ["--cache", args.cache]
+    proc = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)))
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while True:
+        if proc.poll() is not None:
+            raise SystemExit(f"worker exited with {proc.returncode} before it was ready")
+        try:
+            httpx.get(base_url + PROBE_PATH, timeout=1).raise_for_status()
+            return proc, port
+        except httpx.HTTPError:
+            if time.monotonic() > deadline:
+                proc.terminate()
+                raise SystemExit("worker did not start within 30s")
+            time.sleep(0.1)
+
+async def drive(args, client, mix: dict, rates: list) -> list:
+    if args.warmup:
+        await run_rate(client, rates[0], args.warmup, mix, args.timeout, args.seed)
+    return [
+        await run_rate(client, rate, args.duration, mix, args.timeout, args.seed + i)
+        for i, rate in enumerate(rates)
+    ]
+
+async def main_async(args) -> dict:
+    mix = parse_mix(args.mix)
+    rates = [float(r) for r in args.rate.split(",")]
+    if args.in_process:
+        api = setup_app(args)
+        probe = LagProbe(args.lag_interval)
+        probe.start()
+        transport = httpx.ASGITransport(app=api.app)
+        # Lifespan as under uvicorn: shared upstream pool, pre-warm and keep-alive pings
+        async with api.lifespan(api.app), httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+            runs = await drive(args, InProcessClient(client, probe), mix, rates)
+        probe.task.cancel()
+    else:
+        proc, port = await asyncio.to_thread(start_worker, args)
+        client = SocketClient("127.0.0.1", port)
+        try:
+            runs = await drive(args, client, mix, rates)
+        finally:
+            client.close()
+            proc.terminate()
+            proc.wait()
+    backend = args.cache if args.cache is not None else os.environ.get("MOVIEBOX_CACHE", "")
+    return {
+        "config": {
+            "mode": "in-process" if args.in_process else "uvicorn",
+            "duration_s": args.duration,
+            "mix": mix,
+            "upstream_latency_ms": args.latency,
+            "upstream_jitter_ms": args.jitter,
+            "cache": backend.partition(":")[0] if backend and backend != "none" else "none",
+            "python": sys.version.split()[0],
+        },
+        "runs": runs,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Open-loop load test of a single API worker against the stand-in upstream"
+    )
+    parser.add_argument("--rate", default="50", help="offered requests/second; comma-separated to sweep (e.g. 25,50,100)")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per rate")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds of untimed warm-up at the first rate")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"endpoint weights (default {DEFAULT_MIX})")
+    parser.add_argument("--latency", type=float, default=50.0, help="injected upstream latency in ms")
+    parser.add_argument("--jitter", type=float, default=20.0, help="extra uniform random upstream latency in ms")
+    parser.add_argument("--cache", help="cache backend URL as in MOVIEBOX_CACHE (default: the environment's)")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--lag-interval", type=float, default=0.01, help="event-loop lag probe interval in seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("-o", "--output", help="also write the JSON report to this file")
+    parser.add_argument("--in-process", action="store_true",
+                        help="run the app on the load generator's event loop instead of a uvicorn worker process")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+    report = asyncio.run(main_async(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CPU_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (1_000, 5_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000, 5_000_000)
+
+REGISTRY: list = []
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels.get(n, "") for n in self.labelnames), 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+            for key, v in items
+        ]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts..., +Inf count, sum]
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 2)
+            row[slot] += 1
+            row[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = []
+        for key, row in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), row[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(row[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+def render() -> str:
+    out = []
+    for metric in REGISTRY:
+        out.append(f"# HELP {metric.name} {metric.help}")
+        out.append(f"# TYPE {metric.name} {metric.kind}")
+        out.extend(metric.render())
+    return "\n".join(out) + "\n"
+
+UPSTREAM_LATENCY = Histogram(
+    "moviebox_upstream_request_seconds",
+    "Upstream request latency including body download.",
+    ("host", "route"),
+)
+UPSTREAM_RESPONSE_BYTES = Histogram(
+    "moviebox_upstream_response_bytes",
+    "Upstream response body size.",
+    ("host", "route"),
+    buckets=SIZE_BUCKETS,
+)
+UPSTREAM_RESPONSES = Counter(
+    "moviebox_upstream_responses_total",
+    "Upstream responses by status code.",
+    ("host", "route", "status"),
+)
+HTML_PARSE_SECONDS = Histogram(
+    "moviebox_html_parse_seconds",
+    "BeautifulSoup parse time.",
+    ("route",),
+    buckets=CPU_BUCKETS,
+)
+POSTER_MAP_SECONDS = Histogram(
+    "moviebox_poster_map_build_seconds",
+    "Time spent in build_*_to_poster_map.",
+    ("builder",),
+    buckets=CPU_BUCKETS,
+)
+SERIALIZE_SECONDS = Histogram(
+    "moviebox_serialize_seconds",
+    "JSON response serialization time.",
+    ("route",),
+    buckets=CPU_BUCKETS,
+)
+EMPTY_SECTIONS = Counter(
+    "moviebox_empty_section_results_total",
+    "Requests whose parse produced no sections, or sections with no cards.",
+    ("route", "kind"),
+)
+CACHE_REQUESTS = Counter(
+    "moviebox_cache_requests_total",
+    "Cache lookups by cache name and result (hit/miss/shared/error).",
+    ("cache", "result"),
+)
+POSTER_RENDER_SECONDS = Histogram(
+    "moviebox_poster_render_seconds",
+    "Time to resize and encode one poster variant in the worker pool.",
+    ("format",),
+    buckets=CPU_BUCKETS,
+)
+HOME_FEED_RESPONSES = Counter(
+    "moviebox_home_feed_responses_total",
+    "Versioned home responses by channel (poll/push) and kind (full/delta/unchanged).",
+    ("channel", "kind"),
+)
+HOME_FEED_SUBSCRIBERS = Gauge(
+    "moviebox_home_feed_subscribers",
+    "Open /home/events streams.",
+)
+BUNDLE_PARTS = Counter(
+    "moviebox_bundle_parts_total",
+    "Parts served by /bundle, by part and result (ok/timeout/error).",
+    ("part", "result"),
+)
+
+def record_empty_sections(sections: list, route: str):
+    if not sections:
+        EMPTY_SECTIONS.inc(route=route, kind="no_sections")
+    for s in sections:
+        if not s["count"]:
+            EMPTY_SECTIONS.inc(route=route, kind="empty_section")
@@ -0,0 +1,105 @@
+import re
+import json
+import json.scanner
+
+# Decoding of the __NUXT_DATA__ payload Nuxt embeds in every page: a flat JSON array
+# whose dicts and lists refer to other elements by index
+
+_OPEN_TAG = re.compile(r'<script[^>]+id="__NUXT_DATA__"[^>]*>')
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Longest opening tag we expect; while searching, only this much of a chunk is kept so
+# a tag split across chunks is still found
+_TAG_TAIL = 512
+
+_decoder = json.JSONDecoder()
+_scan = json.scanner.make_scanner(_decoder)
+
+class NuxtDataError(ValueError):
+    pass
+
+class NuxtDataMissing(NuxtDataError):
+    pass
+
+class NuxtDataNotArray(NuxtDataError):
+    pass
+
+def decode(raw_html: str):
+    # Decodes straight out of the page, without copying the script body first
+    match = _OPEN_TAG.search(raw_html)
+    if not match:
+        raise NuxtDataMissing("no __NUXT_DATA__ script in the page")
+    start = _WHITESPACE.match(raw_html, match.end()).end()
+    try:
+        return _decoder.raw_decode(raw_html, start)[0]
+    except json.JSONDecodeError as e:
+        raise NuxtDataError(f"invalid __NUXT_DATA__: {e}") from e
+
+# Incremental decoder for a page that is still downloading: feed() takes text as it
+# arrives and returns the (index, value) pairs completed so far. Only the unconsumed
+# tail of the text is kept, never the page or the script body.
+class ArrayStream:
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.state = "tag"  # tag -> open -> first -> value/next ... -> done
+        self.count = 0
+
+    @property
+    def done(self) -> bool:
+        return self.state == "done"
+
+    def feed(self, text: str) -> list[tuple[int, object]]:
+        if self.state == "done":
+            return []
+        buffer = self.buffer[self.pos:] + text if self.pos < len(self.buffer) else text
+        pos = 0
+        out = []
+        if self.state == "tag":
+            match = _OPEN_TAG.search(buffer)
+            if not match:
+                self.buffer, self.pos = buffer[-_TAG_TAIL:], 0
+                return out
+            pos, self.state = match.end(), "open"
+        if self.state == "open":
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos < len(buffer):
+                if buffer[pos] != "[":
+                    raise NuxtDataNotArray("__NUXT_DATA__ is not an array")
+                pos, self.state = pos + 1, "first"
+
+        # Nuxt writes the array without whitespace, so the regex is rarely needed
+        size, state, count = len(buffer), self.state, self.count
+        while state != "open":
+            if pos < size and buffer[pos] in " \t\n\r":
+                pos = _WHITESPACE.match(buffer, pos).end()
+            if pos == size:
+                break
+            char = buffer[pos]
+            if state == "next" or (state == "first" and char == "]"):
+                if char == "]":
+                    pos, state = pos + 1, "done"
+                    break
+                if char != ",":
+                    raise NuxtDataError(f"invalid __NUXT_DATA__: expected ',' or ']' at element {count}")
+                pos, state = pos + 1, "value"
+                continue
+            try:
+                value, end = _scan(buffer, pos)
+            except (StopIteration, json.JSONDecodeError):
+                # The element is cut off at the end of this chunk; retried with the next
+                break
+            if end == size or (type(value) in (int, float) and buffer[end] not in ",] \t\n\r"):
+                # A number cut off by the chunk ("7." or "1e") scans as its prefix; it is
+                # only complete once a delimiter follows
+                break
+            out.append((count, value))
+            count += 1
+            pos, state = end, "next"
+        self.buffer, self.pos, self.state, self.count = buffer, pos, state, count
+        return out
+
+    def close(self):
+        if self.state == "tag":
+            raise NuxtDataMissing("no __NUXT_DATA__ script in the page")
+        if self.state != "done":
+            raise NuxtDataError(f"invalid or truncated __NUXT_DATA__ after element {self.count}")
@@ -0,0 +1,161 @@
+import io
+import os
+import time
+import asyncio
+import tempfile
+import functools
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, quote, urlsplit
+
+import httpx
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+
+import metrics
+import upstream
+from disk_cache import DiskCache
+
+ALLOWED_HOSTS = {"pbcdnw.aoneroom.com"}
+WIDTHS = (150, 300, 600)
+FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+MAX_ORIGINAL_BYTES = 10 * 1024 * 1024
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+# An original standing in for a variant without Pillow must not outlive Pillow's absence
+FALLBACK_CACHE_CONTROL = "public, max-age=3600"
+
+PUBLIC_URL = os.environ.get("MOVIEBOX_PUBLIC_URL", "").rstrip("/")
+CACHE_DIR = os.environ.get("MOVIEBOX_POSTER_CACHE_DIR", os.path.join(tempfile.gettempdir(), "moviebox-posters"))
+CACHE_MB = int(os.environ.get("MOVIEBOX_POSTER_CACHE_MB", "512"))
+WORKERS = int(os.environ.get("MOVIEBOX_POSTER_WORKERS", "2"))
+
+FETCH_HEADERS = {"User-Agent": upstream.HEADERS["User-Agent"], "Referer": upstream.HEADERS["Referer"]}
+TIMEOUT = httpx.Timeout(15)
+
+router = APIRouter()
+
+# Pillow is optional and imported on first use; without it only originals are served
+@functools.lru_cache(maxsize=None)
+def pillow():
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+@functools.lru_cache(maxsize=None)
+def poster_cache() -> DiskCache:
+    return DiskCache("posters", CACHE_DIR, CACHE_MB * 1024 * 1024)
+
+# Pillow releases the GIL while decoding, resampling and encoding, so threads are enough
+# to keep that work off the event loop
+@functools.lru_cache(maxsize=None)
+def _pool() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="poster")
+
+def snap_width(width: int) -> int:
+    for w in WIDTHS:
+        if width <= w:
+            return w
+    return WIDTHS[-1]
+
+def variant_url(url: str, width: int, fmt: str = "webp") -> str:
+    if not url or urlsplit(url).hostname not in ALLOWED_HOSTS:
+        return url
+    return f"{PUBLIC_URL}/poster?url={quote(url, safe='')}&w={snap_width(width)}&fmt={fmt}"
+
+# Listing requests opt in with ?poster=<width>[&poster_format=jpeg]; cards are rewritten
+# at serialization time so cached records keep the upstream URL
+def rewriter(scope):
+    if scope is None or b"poster=" not in scope.get("query_string", b""):
+        return None
+    params = parse_qs(scope["query_string"].decode("latin-1"))
+    try:
+        width = int(params["poster"][0])
+    except (KeyError, ValueError):
+        return None
+    fmt = params.get("poster_format", ["webp"])[0]
+    if fmt not in FORMATS:
+        fmt = "webp"
+    return lambda url: variant_url(url, width, fmt)
+
+# Concurrent requests for the same original or variant share one fetch or render
+_pending: dict[str, asyncio.Future] = {}
+
+async def _single_flight(key: str, make):
+    future = _pending.get(key)
+    if future is None:
+        future = _pending[key] = asyncio.ensure_future(make())
+        future.add_done_callback(lambda _: _pending.pop(key, None))
+    else:
+        metrics.CACHE_REQUESTS.inc(cache="posters", result="shared")
+    # Shielded so a client that disconnects does not cancel the work for everyone else
+    return await asyncio.shield(future)
+
+async def _fetch_original(url: str, key: str) -> str:
+    async with upstream.client(follow_redirects=True, timeout=TIMEOUT) as client:
+        resp = await client.get(url, headers=FETCH_HEADERS)
+    if resp.status_code != 200:
+        raise HTTPException(status_code=502, detail=f"Upstream poster returned {resp.status_code}")
+    if not resp.headers.get("content-type", "image/").startswith("image/"):
+        raise HTTPException(status_code=502, detail="Upstream poster is not an image")
+    if len(resp.content) > MAX_ORIGINAL_BYTES:
+        raise HTTPException(status_code=502, detail="Upstream poster is too large")
+    path = poster_cache().put(key, resp.content)
+    if path is None:
+        raise HTTPException(status_code=502, detail="Upstream poster does not fit in the cache")
+    return path
+
+async def _original(url: str) -> str:
+    cache = poster_cache()
+    key = cache.key(url)
+    return cache.get(key) or await _single_flight(key, lambda: _fetch_original(url, key))
+
+def _render_variant(path: str, width: int, fmt: str) -> bytes:
+    Image = pillow()
+    start = time.perf_counter()
+    with Image.open(path) as im:
+        # For JPEG sources this decodes at a reduced scale instead of full size
+        im.draft("RGB", (width, width * 4))
+        im.thumbnail((width, im.height), Image.LANCZOS)
+        if fmt == "jpeg":
+            im = im.convert("RGB")
+        elif im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGBA")
+        out = io.BytesIO()
+        im.save(out, format=fmt.upper(), quality=80, optimize=fmt == "jpeg")
+    metrics.POSTER_RENDER_SECONDS.observe(time.perf_counter() - start, format=fmt)
+    return out.getvalue()
+
+async def _build_variant(url: str, width: int, fmt: str, key: str) -> str:
+    original = await _original(url)
+    loop = asyncio.get_running_loop()
+    try:
+        data = await loop.run_in_executor(_pool(), _render_variant, original, width, fmt)
+    except (OSError, ValueError, pillow().DecompressionBombError) as e:
+        raise HTTPException(status_code=502, detail=f"Poster could not be resized: {e}")
+    path = poster_cache().put(key, data)
+    if path is None:
+        raise HTTPException(status_code=502, detail="Poster variant does not fit in the cache")
+    return path
+
+async def _variant(url: str, width: int, fmt: str) -> str:
+    cache = poster_cache()
+    key = cache.key(url, width, fmt)
+    return cache.get(key) or await _single_flight(key, lambda: _build_variant(url, width, fmt, key))
+
+@router.get("/poster")
+async def get_poster(url: str, w: int = 0, fmt: str = "webp"):
+    if urlsplit(url).scheme != "https" or urlsplit(url).hostname not in ALLOWED_HOSTS:
+        raise HTTPException(status_code=400, detail=f"Only posters on {', '.join(sorted(ALLOWED_HOSTS))} are served")
+    if w and w not in WIDTHS:
+        raise HTTPException(status_code=400, detail={"message": f"Unsupported width {w}", "widths": list(WIDTHS)})
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail={"message": f"Unsupported format {fmt!r}", "formats": list(FORMATS)})
+
+    if w and pillow() is not None:
+        headers = {"Cache-Control": CACHE_CONTROL}
+        return FileResponse(await _variant(url, w, fmt), media_type=FORMATS[fmt], headers=headers)
+    headers = {"Cache-Control": FALLBACK_CACHE_CONTROL if w else CACHE_CONTROL}
+    media_type = mimetypes.guess_type(urlsplit(url).path)[0] or "image/jpeg"
+    return FileResponse(await _original(url), media_type=media_type, headers=headers)
@@ -0,0 +1,131 @@
+import sys
+import json
+
+DETAIL_URL_PREFIX = "https://moviebox.ph/detail/"
+
+# Marks a card whose url is DETAIL_URL_PREFIX + slug and is rebuilt on access.
+# Ellipsis is a singleton that survives pickling, unlike object().
+_DERIVED = ...
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+class Record:
+    __slots__ = ()
+    FIELDS: tuple = ()
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.FIELDS else default
+
+    def keys(self) -> tuple:
+        return self.FIELDS
+
+    def as_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.FIELDS}
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.as_dict() == other.as_dict()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.as_dict()!r})"
+
+class Card(Record):
+    __slots__ = ("name", "slug", "poster_url", "badge", "_url")
+
+    def __init__(self, name, url, slug, poster_url=None, badge=None):
+        self.name = name
+        self.slug = _intern(slug)
+        self.poster_url = poster_url
+        self.badge = _intern(badge)
+        self._url = _DERIVED if slug and url == DETAIL_URL_PREFIX + slug else url
+
+    @property
+    def url(self):
+        return DETAIL_URL_PREFIX + self.slug if self._url is _DERIVED else self._url
+
+# Key order of each card type matches the dicts the endpoints returned before records
+
+class MovieCard(Card):
+    __slots__ = ("blurhash",)
+    FIELDS = ("name", "url", "slug", "poster_url", "badge", "blurhash")
+
+    def __init__(self, name, url, slug, poster_url=None, badge=None, blurhash=None):
+        super().__init__(name, url, slug, poster_url, badge)
+        self.blurhash = blurhash
+
+class PageCard(Card):
+    __slots__ = ("year", "rating")
+    FIELDS = ("name", "url", "slug", "poster_url", "year", "rating", "badge", "blurhash")
+    blurhash = None
+
+    def __init__(self, name, url, slug, poster_url=None, year=None, rating=None):
+        super().__init__(name, url, slug, poster_url)
+        self.year = _intern(year)
+        self.rating = _intern(rating)
+
+class RankCard(Card):
+    __slots__ = ("rank",)
+    FIELDS = ("name", "url", "slug", "rank", "poster_url", "badge")
+
+    def __init__(self, name, url, slug, rank=None, poster_url=None, badge=None):
+        super().__init__(name, url, slug, poster_url, badge)
+        self.rank = _intern(rank)
+
+class FeedCard(Card):
+    __slots__ = ("blurhash",)
+    FIELDS = ("name", "poster_url", "url", "slug", "badge", "blurhash")
+
+    def __init__(self, name, url, slug, poster_url=None, badge=None, blurhash=None):
+        super().__init__(name, url, slug, poster_url, badge)
+        self.blurhash = blurhash
+
+class BannerCard(Card):
+    __slots__ = ()
+    FIELDS = ("name", "poster_url", "url", "badge", "slug")
+
+class Section(Record):
+    __slots__ = ("section", "more_url", "movies")
+    FIELDS = ("section", "more_url", "count", "movies")
+
+    def __init__(self, section, movies, more_url=None):
+        self.section = _intern(section)
+        self.more_url = more_url
+        self.movies = movies
+
+    @property
+    def count(self) -> int:
+        return len(self.movies)
+
+class FeedSection(Section):
+    __slots__ = ()
+    FIELDS = ("section", "count", "movies", "more_url")
+
+def _default(obj):
+    if isinstance(obj, Record):
+        return obj.as_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def _poster_default(poster_url):
+    def default(obj):
+        data = _default(obj)
+        if isinstance(obj, Card) and data["poster_url"]:
+            data["poster_url"] = poster_url(data["poster_url"])
+        return data
+    return default
+
+def dumps(content, poster_url=None) -> bytes:
+    # Same settings as starlette's JSONResponse.render, so output is byte-identical.
+    # poster_url, if given, maps each card's poster_url without touching the record.
+    return json.dumps(
+        content,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+        default=_poster_default(poster_url) if poster_url else _default,
+    ).encode("utf-8")
@@ -0,0 +1,16 @@
+from fastapi.responses import JSONResponse
+
+import metrics
+import timing
+import upstream
+import poster_cache
+from records import dumps
+
+def render_json(content, scope) -> bytes:
+    return dumps(content, poster_url=poster_cache.rewriter(scope))
+
+# Default response class of the app: renders records directly and times the serialize stage
+class TimedJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        with timing.stage("serialize"), metrics.SERIALIZE_SECONDS.time(route=upstream.route_label()):
+            return render_json(content, upstream.current_scope.get())
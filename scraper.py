@@ -0,0 +1,610 @@
+import re
+import time
+import functools
+import contextlib
+from typing import TYPE_CHECKING
+from fastapi import APIRouter, HTTPException
+
+import cache
+import metrics
+import timing
+import nuxt
+import upstream
+import stream_proxy
+from upstream import BASE_URL, HEADERS
+from rendering import TimedJSONResponse
+from records import Section, MovieCard, PageCard, RankCard
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
+
+# Routes that scrape moviebox.ph HTML pages. Not loaded when MOVIEBOX_API_ONLY=1.
+router = APIRouter()
+
+def _parse_html(raw_html: str) -> "BeautifulSoup":
+    # Imported on first use: workers that never scrape never load bs4
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(raw_html, "html.parser")
+
+async def fetch_page() -> tuple["BeautifulSoup", str]:
+    return await fetch_tab("/")
+
+async def fetch_tab(path: str) -> tuple["BeautifulSoup", str]:
+    url = BASE_URL + path if path.startswith("/") else path
+    headers = {**HEADERS, "Referer": url}
+    async with upstream.client(follow_redirects=True, timeout=25) as client:
+        response = await client.get(url, headers=headers)
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=502,
+                detail=f"Failed to fetch {url}: HTTP {response.status_code}"
+            )
+        with timing.stage("decode"):
+            raw_html = response.text
+        with timing.stage("html-parse"), metrics.HTML_PARSE_SECONDS.time(route=upstream.route_label()):
+            soup = _parse_html(raw_html)
+        return soup, raw_html
+
+# Streams a page and decodes its __NUXT_DATA__ array while the body arrives, calling
+# on_element(index, value) as each element completes. The page is never held in memory
+# and the rest of the body is skipped once the array is closed.
+async def fetch_nuxt(url: str, headers: dict, on_element, timeout: float = 30) -> tuple[int, list]:
+    stream = nuxt.ArrayStream()
+    data = []
+    async with upstream.client() as client:
+        request = client.build_request("GET", url, headers=headers, timeout=timeout, extensions={"streaming": True})
+        resp = await client.send(request, stream=True)
+        try:
+            if resp.status_code != 200:
+                return resp.status_code, data
+            waited = time.perf_counter()
+            async with contextlib.aclosing(resp.aiter_text()) as chunks:
+                async for chunk in chunks:
+                    timing.record("fetch", time.perf_counter() - waited)
+                    with timing.stage("nuxt-parse"):
+                        elements = stream.feed(chunk)
+                    with timing.stage("extract"):
+                        for index, value in elements:
+                            data.append(value)
+                            on_element(index, value)
+                    if stream.done:
+                        break
+                    waited = time.perf_counter()
+            stream.close()
+        finally:
+            metrics.UPSTREAM_RESPONSE_BYTES.observe(resp.num_bytes_downloaded, host=resp.url.host, route=upstream.route_label())
+            await resp.aclose()
+    return resp.status_code, data
+
+def _timed_poster_map(builder: str):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(raw_html: str) -> dict[str, str]:
+            with timing.stage("map-build"), metrics.POSTER_MAP_SECONDS.time(builder=builder):
+                return func(raw_html)
+        return wrapper
+    return decorator
+
+def _loads_nuxt(raw_html: str):
+    with timing.stage("nuxt-parse"):
+        return nuxt.decode(raw_html)
+
+@_timed_poster_map("blurhash")
+def build_blurhash_to_poster_map(raw_html: str) -> dict[str, str]:
+    try:
+        data = _loads_nuxt(raw_html)
+    except nuxt.NuxtDataError:
+        return {}
+
+    if not isinstance(data, list):
+        return {}
+
+    mapping: dict[str, str] = {}
+    cdn_indices = [
+        i for i, v in enumerate(data)
+        if isinstance(v, str) and "pbcdnw.aoneroom.com" in v
+    ]
+
+    for idx in cdn_indices:
+        url = data[idx]
+        for offset in range(1, 12):
+            for direction in (1, -1):
+                neighbor_idx = idx + (direction * offset)
+                if 0 <= neighbor_idx < len(data):
+                    candidate = data[neighbor_idx]
+                    if (
+                        isinstance(candidate, str)
+                        and 8 < len(candidate) < 90
+                        and re.match(r'^[A-Za-z0-9$%^&*:;,|{}\[\]~\-=+.@#!?_()/<>\'` ]+$', candidate)
+                        and not candidate.startswith("http")
+                        and not candidate.startswith("/")
+                        and "." not in candidate[:4]
+                        and candidate not in mapping
+                    ):
+                        mapping[candidate] = url
+                        break
+    return mapping
+
+@_timed_poster_map("slug")
+def build_slug_to_poster_map(raw_html: str) -> dict[str, str]:
+    try:
+        data = _loads_nuxt(raw_html)
+    except nuxt.NuxtDataError:
+        return {}
+    if not isinstance(data, list):
+        return {}
+
+    mapping: dict[str, str] = {}
+    slug_re = re.compile(r'^[a-z][a-z0-9\-]+-[a-zA-Z0-9]{11}$')
+
+    for idx, v in enumerate(data):
+        if not isinstance(v, str):
+            continue
+        if not slug_re.match(v) or '-' not in v:
+            continue
+        if v in mapping:
+            continue
+
+        for offset in range(1, 26):
+            ni = idx - offset
+            if ni < 0:
+                break
+            candidate = data[ni]
+            if isinstance(candidate, str) and "pbcdnw.aoneroom.com" in candidate:
+                mapping[v] = candidate
+                break
+
+    return mapping
+
+def parse_movie_card(card, blurhash_map: dict) -> MovieCard:
+    href = card.get("href", "")
+    title_attr = card.get("title", "")
+
+    name_tag = card.find("p")
+    if name_tag:
+        name = name_tag.get_text(separator=" ", strip=True)
+    elif title_attr:
+        name = re.sub(r"^go to\s+", "", title_attr, flags=re.IGNORECASE)
+        name = re.sub(r"\s+detail page$", "", name, flags=re.IGNORECASE)
+    else:
+        name = ""
+
+    slug = href.split("/detail/")[-1] if "/detail/" in href else None
+
+    thumb_span = card.find("span", attrs={"thumbnail": True})
+    blurhash = thumb_span.get("thumbnail") if thumb_span else None
+    poster_url = blurhash_map.get(blurhash) if blurhash else None
+
+    badge_span = card.find("span", class_=lambda c: c and "text-white" in c if c else False)
+    badge = badge_span.get_text(strip=True) if badge_span else None
+
+    return MovieCard(
+        name=name,
+        url=BASE_URL + href if href.startswith("/") else href,
+        slug=slug,
+        poster_url=poster_url,
+        badge=badge,
+        blurhash=blurhash,
+    )
+
+def parse_sections(soup: "BeautifulSoup", blurhash_map: dict) -> list[Section]:
+    sections = []
+    seen_titles = set()
+
+    for box in soup.find_all("div", class_="movie-card-list-box"):
+        title_div = box.find("div", class_=lambda c: c and "title" in c.split() if c else False)
+        if not title_div:
+            continue
+
+        raw_title = title_div.get_text(strip=True)
+        if not raw_title or raw_title in seen_titles:
+            continue
+        seen_titles.add(raw_title)
+
+        more_link = box.find("a", class_=lambda c: c and "action-bar" in c.split() if c else False)
+        more_href = more_link.get("href") if more_link else None
+        more_url = (BASE_URL + more_href if more_href and more_href.startswith("/") else more_href) if more_href else None
+
+        movie_cards = box.find_all("a", class_="movie-card")
+        if not movie_cards:
+            continue
+
+        movies = [parse_movie_card(card, blurhash_map) for card in movie_cards]
+
+        sections.append(Section(raw_title, movies, more_url=more_url))
+
+    return sections
+
+def parse_card_page(soup: "BeautifulSoup", slug_map: dict) -> list[Section]:
+    cards = soup.find_all("a", class_="card",
+                          href=lambda h: h and "/detail/" in h if h else False)
+    movies = []
+    for card in cards:
+        href = card.get("href", "")
+        slug = href.split("/detail/")[-1] if "/detail/" in href else None
+
+        h2 = card.find("h2", class_=lambda c: c and "card-title" in c.split() if c else False)
+        name = h2.get_text(strip=True) if h2 else (slug or "")
+
+        year_div = card.find("div", class_=lambda c: c and "text-white" in c and "text-[12px]" in c if c else False)
+        year = year_div.get_text(strip=True) if year_div else None
+
+        rating_span = card.find("span")
+        rating = rating_span.get_text(strip=True) if rating_span else None
+
+        poster_url = slug_map.get(slug) if slug else None
+
+        movies.append(PageCard(
+            name=name,
+            url=BASE_URL + href if href.startswith("/") else href,
+            slug=slug,
+            poster_url=poster_url,
+            year=year,
+            rating=rating,
+        ))
+
+    if not movies:
+        return []
+    return [Section("All", movies)]
+
+def parse_movie_filter_page(soup: "BeautifulSoup", blurhash_map: dict, slug_map: dict, raw_html: str) -> list[Section]:
+    all_cards = soup.find_all("a", href=lambda h: h and "/detail/" in h if h else False)
+    movies = []
+    seen_slugs: set = set()
+    for card in all_cards:
+        href = card.get("href", "")
+        slug = href.split("/detail/")[-1] if "/detail/" in href else None
+        if not slug or slug in seen_slugs:
+            continue
+        seen_slugs.add(slug)
+
+        name_tag = card.find("p") or card.find(
+            "h2", class_=lambda c: c and "card-title" in c if c else False
+        )
+        name = name_tag.get_text(strip=True) if name_tag else slug
+
+        thumb = card.find("span", attrs={"thumbnail": True})
+        blurhash = thumb.get("thumbnail") if thumb else None
+        poster_url = blurhash_map.get(blurhash) if blurhash else None
+
+        badge_span = card.find("span", class_=lambda c: c and "text-white" in c if c else False)
+        badge = badge_span.get_text(strip=True) if badge_span else None
+
+        movies.append(MovieCard(
+            name=name,
+            url=BASE_URL + href if href.startswith("/") else href,
+            slug=slug,
+            poster_url=poster_url,
+            badge=badge,
+            blurhash=blurhash,
+        ))
+    if not movies:
+        try:
+            data = _loads_nuxt(raw_html)
+            slugs_idx = [ (i, v) for i, v in enumerate(data) if isinstance(v, str) and '/detail/' not in v and re.match(r'^[a-z0-9][a-z0-9\-]{3,}-[a-zA-Z0-9]{11}$', v)]
+            for idx, slug in slugs_idx:
+                if slug in seen_slugs:
+                    continue
+                seen_slugs.add(slug)
+                
+                name = slug
+                for j in range(max(0, idx-10), min(len(data), idx+10)):
+                    val = data[j]
+                    if isinstance(val, str) and len(val) > 2 and not val.startswith('http') and not re.match(r'^[a-z0-9\-]+$', val):
+                        name = val.replace("Trailer-", "").strip()
+                        break
+                        
+                movies.append(MovieCard(
+                    name=name,
+                    url=BASE_URL + f"/detail/{slug}",
+                    slug=slug,
+                    poster_url=slug_map.get(slug),
+                ))
+        except Exception:
+            pass
+
+    if not movies:
+        return []
+    return [Section("All Movies", movies)]
+
+def _resolve_nuxt_data(data, index):
+    if not isinstance(index, int) or index < 0 or index >= len(data):
+        return index 
+    val = data[index]
+    if isinstance(val, dict):
+        return {k: _resolve_nuxt_data(data, v) for k, v in val.items()}
+    elif isinstance(val, list):
+        return [_resolve_nuxt_data(data, i) for i in val]
+    else:
+        return val
+
+@cache.cached("detail")
+async def _detail_data(slug: str):
+    url = f"https://moviebox.ph/detail/{slug}"
+    headers = {"User-Agent": "Mozilla/5.0"}
+    
+    movie_index = None
+    stream_urls, hls_urls = [], []
+
+    # Collected while the page downloads; only the subject needs the complete array
+    def collect(index, value):
+        nonlocal movie_index
+        if isinstance(value, str):
+            if '.mp4' in value:
+                stream_urls.append(value)
+            if '.m3u8' in value or '/m3u8/' in value:
+                hls_urls.append(value)
+        elif movie_index is None and isinstance(value, dict) and 'subjectId' in value and 'title' in value and 'duration' in value:
+            movie_index = index
+
+    try:
+        status, nuxt_json = await fetch_nuxt(url, headers, collect)
+    except nuxt.NuxtDataMissing:
+        raise HTTPException(status_code=500, detail="Could not find NUXT data in the page")
+    except nuxt.NuxtDataNotArray:
+        raise HTTPException(status_code=500, detail="Unexpected NUXT data format")
+    except nuxt.NuxtDataError:
+        raise HTTPException(status_code=500, detail="Failed to parse NUXT data")
+
+    if status != 200:
+        raise HTTPException(status_code=404, detail="Movie not found")
+
+    with timing.stage("extract"):
+        movie_dict = _resolve_nuxt_data(nuxt_json, movie_index) if movie_index is not None else None
+
+    if not movie_dict:
+        raise HTTPException(status_code=404, detail="Could not extract movie metadata from NUXT")
+
+    streams = {
+        "mp4": stream_urls,
+        "hls": hls_urls
+    }
+    if stream_proxy.ENABLED:
+        streams["proxy"] = {
+            "mp4": [stream_proxy.proxy_url(u) for u in stream_urls],
+            "hls": [stream_proxy.proxy_url(u) for u in hls_urls],
+        }
+
+    return {
+        "slug": slug,
+        "source": url,
+        "metadata": {
+            "id": movie_dict.get("subjectId"),
+            "title": movie_dict.get("title"),
+            "description": movie_dict.get("description"),
+            "release_date": movie_dict.get("releaseDate"),
+            "duration": movie_dict.get("duration"),
+            "genre": movie_dict.get("genre"),
+            "country": movie_dict.get("countryName"),
+            "imdb_rating": movie_dict.get("imdbRatingValue"),
+            "poster": movie_dict.get("cover", {}).get("url") if isinstance(movie_dict.get("cover"), dict) else None,
+            "badge": movie_dict.get("corner"),
+            "dubs": movie_dict.get("dubs", [])
+        },
+        "streams": streams
+    }
+
+@router.get("/detail/{slug}")
+async def get_movie_detail(slug: str):
+    return TimedJSONResponse(await _detail_data(slug))
+
+def parse_ranking_page(soup: "BeautifulSoup", slug_map: dict) -> list[Section]:
+    rank_lists = soup.find_all("div", class_=lambda c: c and "rank-subject-list" in c if c else False)
+
+    all_movies = []
+    seen_slugs: set = set()
+    for rl in rank_lists:
+        cards = rl.find_all("a", class_=lambda c: c and "rank-subject-item" in c if c else False)
+        for card in cards:
+            href = card.get("href", "")
+            slug = href.split("/detail/")[-1] if "/detail/" in href else None
+            if slug in seen_slugs:
+                continue
+            seen_slugs.add(slug)
+
+            title_div = card.find("div", class_="title-text")
+            name = title_div.get_text(strip=True) if title_div else (slug or "")
+
+            rank_num_div = card.find("div", class_="ranking-corner-num")
+            rank = rank_num_div.get_text(strip=True) if rank_num_div else None
+
+            badge_span = card.find("span", class_="special-tag-text")
+            badge = badge_span.get_text(strip=True) if badge_span else None
+
+            poster_url = slug_map.get(slug) if slug else None
+
+            all_movies.append(RankCard(
+                name=name,
+                url=BASE_URL + href if href.startswith("/") else href,
+                slug=slug,
+                rank=rank,
+                poster_url=poster_url,
+                badge=badge,
+            ))
+
+    if not all_movies:
+        return []
+    return [Section("Most Watched", all_movies)]
+
+@_timed_poster_map("title")
+def build_title_to_poster_map(raw_html: str) -> dict[str, str]:
+    try:
+        data = _loads_nuxt(raw_html)
+    except nuxt.NuxtDataError:
+        return {}
+    if not isinstance(data, list):
+        return {}
+
+    mapping: dict[str, str] = {}
+    for idx, v in enumerate(data):
+        if not isinstance(v, str) or len(v) < 2 or len(v) > 120:
+            continue
+        if "pbcdnw.aoneroom.com" not in v:
+            continue
+        for offset in range(1, 51):
+            ni = idx + offset
+            if ni >= len(data):
+                break
+            candidate = data[ni]
+            if (
+                isinstance(candidate, str)
+                and 2 < len(candidate) < 100
+                and " " in candidate
+                and not candidate.startswith("http")
+                and not re.match(r'^[a-z0-9\-]+$', candidate)
+                and not re.match(r'^\d{4}', candidate)
+                and candidate not in mapping
+            ):
+                mapping[candidate] = v
+                break
+    return mapping
+
+def parse_banner(soup: "BeautifulSoup", title_map: dict) -> list[dict]:
+    featured = []
+    seen = set()
+
+    for name_div in soup.find_all("div", class_=lambda c: c and "work-name" in c if c else False):
+        name = name_div.get_text(separator=" ", strip=True)
+        name = re.sub(r'\s+', ' ', name).strip()
+        if not name or len(name) < 2 or "MovieBox Communities" in name or name in seen:
+            continue
+        seen.add(name)
+
+        parent = name_div.parent
+        year_div = parent.find("div", class_=lambda c: c and "year" in c if c else False) if parent else None
+        genre_div = parent.find("div", class_=lambda c: c and "type" in c if c else False) if parent else None
+
+        name_clean = re.sub(r'\[.*?\]', '', name).strip().lower()
+        
+        poster_url = None
+        for key, url in title_map.items():
+            key_clean = re.sub(r'\[.*?\]', '', key).strip().lower()
+            if name_clean == key_clean:
+                poster_url = url
+                break
+                
+        if not poster_url and len(name_clean) > 3:
+            for key, url in title_map.items():
+                key_clean = re.sub(r'\[.*?\]', '', key).strip().lower()
+                if name_clean in key_clean or key_clean in name_clean:
+                    poster_url = url
+                    break
+            
+            if not poster_url:
+                words_name = name_clean.split()
+                if len(words_name) >= 2:
+                    for key, url in title_map.items():
+                        key_clean = re.sub(r'\[.*?\]', '', key).strip().lower()
+                        words_key = key_clean.split()
+                        if len(words_key) >= 2 and words_name[0] == words_key[0] and words_name[1] == words_key[1]:
+                            poster_url = url
+                            break
+
+        featured.append({
+            "name": name,
+            "year": year_div.get_text(strip=True) if year_div else None,
+            "genres": genre_div.get_text(strip=True).split(",") if genre_div and genre_div.get_text(strip=True) else [],
+            "poster_url": poster_url,
+        })
+    return featured
+
+@cache.cached("tab")
+async def _tab_sections(path: str) -> tuple[list, int]:
+    soup, raw = await fetch_tab(path)
+    bmap = build_blurhash_to_poster_map(raw)
+    smap = build_slug_to_poster_map(raw)
+
+    with timing.stage("extract"):
+        if soup.find("a", class_="card",
+                     href=lambda h: h and "/detail/" in h if h else False) or "tv-series" in path or "animation" in path:
+            sections = parse_card_page(soup, smap)
+        elif soup.find("a", class_=lambda c: c and "rank-subject-item" in c if c else False) or "ranking" in path:
+            sections = parse_ranking_page(soup, smap)
+        elif soup.find("div", class_=lambda c: c and "filter-name" in " ".join(c) if c else False) or "movie" in path:
+            sections = parse_movie_filter_page(soup, bmap, smap, raw)
+        else:
+            sections = parse_sections(soup, bmap)
+
+    metrics.record_empty_sections(sections, upstream.route_label())
+    return sections, len(bmap)
+
+async def tab_payload(path: str) -> dict:
+    sections, map_size = await _tab_sections(path)
+    return {
+        "source": BASE_URL + path,
+        "total_sections": len(sections),
+        "poster_map_size": map_size,
+        "sections": sections,
+    }
+
+@router.get("/tv-series")
+async def get_tv_series():
+    return TimedJSONResponse(await tab_payload("/web/tv-series"))
+
+@router.get("/tv-series/section/{name}")
+async def get_tv_series_section(name: str):
+    sections, _ = await _tab_sections("/web/tv-series")
+    matched = [s for s in sections if name.lower() in s["section"].lower()]
+    if not matched:
+        raise HTTPException(
+            status_code=404,
+            detail={"message": f"No section matching '{name}'",
+                    "available": [s["section"] for s in sections]}
+        )
+    return TimedJSONResponse({"results": matched})
+
+@router.get("/movies")
+async def get_movies():
+    return TimedJSONResponse(await tab_payload("/web/movie"))
+
+@router.get("/movies/section/{name}")
+async def get_movies_section(name: str):
+    sections, _ = await _tab_sections("/web/movie")
+    matched = [s for s in sections if name.lower() in s["section"].lower()]
+    if not matched:
+        raise HTTPException(
+            status_code=404,
+            detail={"message": f"No section matching '{name}'",
+                    "available": [s["section"] for s in sections]}
+        )
+    return TimedJSONResponse({"results": matched})
+
+@router.get("/animation")
+async def get_animation():
+    return TimedJSONResponse(await tab_payload("/web/animated-series"))
+
+@router.get("/animation/section/{name}")
+async def get_animation_section(name: str):
+    sections, _ = await _tab_sections("/web/animated-series")
+    matched = [s for s in sections if name.lower() in s["section"].lower()]
+    if not matched:
+        raise HTTPException(
+            status_code=404,
+            detail={"message": f"No section matching '{name}'",
+                    "available": [s["section"] for s in sections]}
+        )
+    return TimedJSONResponse({"results": matched})
+
+@router.get("/ranking")
+async def get_ranking():
+    return TimedJSONResponse(await tab_payload("/ranking-list"))
+
+@router.get("/ranking/section/{name}")
+async def get_ranking_section(name: str):
+    sections, _ = await _tab_sections("/ranking-list")
+    matched = [s for s in sections if name.lower() in s["section"].lower()]
+    if not matched:
+        raise HTTPException(
+            status_code=404,
+            detail={"message": f"No section matching '{name}'",
+                    "available": [s["section"] for s in sections]}
+        )
+    return TimedJSONResponse({"results": matched})
+
+# Parts /bundle can combine when the scraping routes are loaded
+BUNDLE_PARTS = {
+    "movies": functools.partial(tab_payload, "/web/movie"),
+    "tv-series": functools.partial(tab_payload, "/web/tv-series"),
+    "animation": functools.partial(tab_payload, "/web/animated-series"),
+    "ranking": functools.partial(tab_payload, "/ranking-list"),
+}
@@ -0,0 +1,236 @@
+import os
+import re
+import hmac
+import asyncio
+import hashlib
+import secrets
+import tempfile
+import functools
+from urllib.parse import quote, urljoin, urlsplit
+
+import httpx
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+import metrics
+import upstream
+from disk_cache import DiskCache
+
+ENABLED = os.environ.get("MOVIEBOX_STREAM_PROXY", "") == "1"
+# Workers must share the secret, or a URL signed by one is rejected by another
+SECRET = (os.environ.get("MOVIEBOX_PROXY_SECRET") or secrets.token_hex(32)).encode()
+PUBLIC_URL = os.environ.get("MOVIEBOX_PUBLIC_URL", "").rstrip("/")
+CACHE_DIR = os.environ.get("MOVIEBOX_SEGMENT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "moviebox-segments"))
+CACHE_MB = int(os.environ.get("MOVIEBOX_SEGMENT_CACHE_MB", "1024"))
+
+CHUNK_SIZE = 64 * 1024
+SEGMENT_TYPES = {
+    ".ts": "video/mp2t",
+    ".m4s": "video/iso.segment",
+    ".aac": "audio/aac",
+    ".m4a": "audio/mp4",
+    ".vtt": "text/vtt",
+    ".webvtt": "text/vtt",
+    ".key": "application/octet-stream",
+}
+RELAY_HEADERS = (
+    "content-type", "content-length", "content-range", "content-encoding",
+    "accept-ranges", "last-modified", "etag",
+)
+FETCH_HEADERS = {"User-Agent": upstream.HEADERS["User-Agent"]}
+TIMEOUT = httpx.Timeout(15, read=60)
+
+router = APIRouter()
+
+def sign(url: str) -> str:
+    return hmac.new(SECRET, url.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+def proxy_url(url: str, segment: bool = False) -> str:
+    path = f"{PUBLIC_URL}/proxy/stream?url={quote(url, safe='')}&sig={sign(url)}"
+    return path + "&seg=1" if segment else path
+
+def _suffix(url: str) -> str:
+    return os.path.splitext(urlsplit(url).path)[1].lower()
+
+def is_playlist(url: str) -> bool:
+    path = urlsplit(url).path
+    return path.endswith(".m3u8") or "/m3u8/" in path
+
+def rewrite_playlist(text: str, base_url: str) -> str:
+    def proxied(uri: str) -> str:
+        target = urljoin(base_url, uri)
+        return proxy_url(target, segment=not is_playlist(target))
+
+    lines = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped and not stripped.startswith("#"):
+            line = proxied(stripped)
+        elif 'URI="' in line:
+            line = re.sub(r'URI="([^"]+)"', lambda m: f'URI="{proxied(m.group(1))}"', line)
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+@functools.lru_cache(maxsize=None)
+def segment_cache() -> DiskCache:
+    return DiskCache("segments", CACHE_DIR, CACHE_MB * 1024 * 1024)
+
+# One upstream download per segment; every concurrent viewer tails the same file
+class _Transfer:
+    def __init__(self, key: str, cache: DiskCache):
+        self.key = key
+        self.file, self.tmp_path = cache.temp_file()
+        self.status = None
+        self.content_type = None
+        self.length = None
+        self.written = 0
+        self.done = False
+        self.error = None
+        self.ready = asyncio.Event()
+        self.task = None
+        self._progress = asyncio.Event()
+
+    def notify(self):
+        self._progress.set()
+        self._progress = asyncio.Event()
+
+    def progress(self) -> asyncio.Event:
+        return self._progress
+
+_transfers: dict[str, _Transfer] = {}
+
+async def _download(transfer: _Transfer, url: str):
+    cache = segment_cache()
+    complete = False
+    try:
+        async with upstream.client(follow_redirects=True, timeout=TIMEOUT) as client:
+            request = client.build_request("GET", url, headers=FETCH_HEADERS, extensions={"streaming": True})
+            resp = await client.send(request, stream=True)
+            try:
+                transfer.status = resp.status_code
+                transfer.content_type = resp.headers.get("content-type") or SEGMENT_TYPES.get(_suffix(url), "application/octet-stream")
+                if "content-encoding" not in resp.headers:
+                    transfer.length = resp.headers.get("content-length")
+                transfer.ready.set()
+                if resp.status_code == 200:
+                    async for chunk in resp.aiter_bytes(CHUNK_SIZE):
+                        transfer.file.write(chunk)
+                        transfer.file.flush()
+                        transfer.written += len(chunk)
+                        transfer.notify()
+                    complete = True
+            finally:
+                await resp.aclose()
+    except Exception as e:
+        transfer.error = e
+    finally:
+        # No awaits from here on: readers that already joined hold open file handles,
+        # and later requests find either the committed file or nothing
+        transfer.file.close()
+        if transfer.status == 200 and not complete and transfer.error is None:
+            transfer.error = RuntimeError("segment download was interrupted")
+        if complete:
+            cache.commit(transfer.tmp_path, transfer.key)
+        else:
+            os.unlink(transfer.tmp_path)
+        _transfers.pop(transfer.key, None)
+        transfer.done = True
+        transfer.ready.set()
+        transfer.notify()
+
+async def _follow(transfer: _Transfer, f):
+    try:
+        pos = 0
+        while True:
+            if pos < transfer.written:
+                chunk = f.read(min(CHUNK_SIZE, transfer.written - pos))
+                pos += len(chunk)
+                yield chunk
+                continue
+            if transfer.done:
+                if transfer.error is not None:
+                    raise transfer.error
+                break
+            await transfer.progress().wait()
+    finally:
+        f.close()
+
+async def _relay_segment(url: str, key: str):
+    cache = segment_cache()
+    transfer = _transfers.get(key)
+    if transfer is None:
+        transfer = _transfers[key] = _Transfer(key, cache)
+        transfer.task = asyncio.create_task(_download(transfer, url))
+    else:
+        metrics.CACHE_REQUESTS.inc(cache="segments", result="shared")
+    # Open before the first await so a finishing download cannot rename the file away
+    f = open(transfer.tmp_path, "rb")
+
+    await transfer.ready.wait()
+    if transfer.status is None:
+        # Failed before any response headers arrived
+        f.close()
+        raise HTTPException(status_code=502, detail=f"Upstream segment failed: {transfer.error!r}")
+    if transfer.status != 200:
+        f.close()
+        raise HTTPException(status_code=502, detail=f"Upstream segment returned {transfer.status}")
+    headers = {"Content-Length": transfer.length} if transfer.length else {}
+    return StreamingResponse(_follow(transfer, f), media_type=transfer.content_type, headers=headers)
+
+async def _relay_playlist(url: str):
+    async with upstream.client(follow_redirects=True, timeout=TIMEOUT) as client:
+        resp = await client.get(url, headers=FETCH_HEADERS)
+    if resp.status_code != 200:
+        raise HTTPException(status_code=502, detail=f"Upstream playlist returned {resp.status_code}")
+    return Response(
+        rewrite_playlist(resp.text, str(resp.url)),
+        media_type="application/vnd.apple.mpegurl",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+async def _close(resp: httpx.Response, client: httpx.AsyncClient):
+    await resp.aclose()
+    await client.aclose()
+
+async def _relay_range(request: Request, url: str):
+    headers = dict(FETCH_HEADERS)
+    if "range" in request.headers:
+        headers["Range"] = request.headers["range"]
+    client = upstream.client(follow_redirects=True, timeout=TIMEOUT)
+    try:
+        upstream_request = client.build_request("GET", url, headers=headers, extensions={"streaming": True})
+        resp = await client.send(upstream_request, stream=True)
+    except httpx.HTTPError as e:
+        await client.aclose()
+        raise HTTPException(status_code=502, detail=f"Upstream stream failed: {e}")
+    if resp.status_code >= 400:
+        await _close(resp, client)
+        raise HTTPException(status_code=502, detail=f"Upstream stream returned {resp.status_code}")
+    return StreamingResponse(
+        resp.aiter_raw(CHUNK_SIZE),
+        status_code=resp.status_code,
+        headers={k: resp.headers[k] for k in RELAY_HEADERS if k in resp.headers},
+        background=BackgroundTask(_close, resp, client),
+    )
+
+@router.get("/proxy/stream")
+async def proxy_stream(request: Request, url: str, sig: str, seg: int = 0):
+    # compare_digest only takes ASCII str, so a non-ASCII sig would raise instead of failing
+    if not hmac.compare_digest(sig.encode("utf-8"), sign(url).encode()):
+        raise HTTPException(status_code=403, detail="Invalid proxy signature")
+    if urlsplit(url).scheme not in ("http", "https"):
+        raise HTTPException(status_code=400, detail="Only http(s) URLs can be proxied")
+
+    if is_playlist(url):
+        return await _relay_playlist(url)
+    if seg or _suffix(url) in SEGMENT_TYPES:
+        cache = segment_cache()
+        key = cache.key(url)
+        path = cache.get(key)
+        if path:
+            return FileResponse(path, media_type=SEGMENT_TYPES.get(_suffix(url), "application/octet-stream"))
+        # A ranged read of an uncached segment is relayed without caching
+        if "range" not in request.headers:
+            return await _relay_segment(url, key)
+    return await _relay_range(request, url)
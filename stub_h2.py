@@ -0,0 +1,184 @@
+import sys
+import time
+import asyncio
+import argparse
+
+import httpx
+import h2.config
+import h2.events
+import h2.exceptions
+import h2.connection
+
+import upstream
+import stub_upstream
+
+# Cleartext HTTP/2 (prior knowledge) server answering from the same fixtures as
+# stub_upstream.py, with counters for connections and concurrently open streams
+
+class StubH2Server:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.connections = 0
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+        self.paths: list[str] = []
+
+class _H2Protocol(asyncio.Protocol):
+    def __init__(self, server: StubH2Server):
+        self.server = server
+        self.conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False, header_encoding="utf-8"))
+        self.streams: dict[int, tuple[dict, bytearray]] = {}
+        self.window_open = asyncio.Event()
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.connections += 1
+        self.conn.initiate_connection()
+        transport.write(self.conn.data_to_send())
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self.window_open.set()
+
+    def data_received(self, data: bytes):
+        try:
+            events = self.conn.receive_data(data)
+        except h2.exceptions.ProtocolError:
+            self.transport.write(self.conn.data_to_send())
+            self.transport.close()
+            return
+        for event in events:
+            if isinstance(event, h2.events.RequestReceived):
+                self.streams[event.stream_id] = (dict(event.headers), bytearray())
+            elif isinstance(event, h2.events.DataReceived):
+                self.streams[event.stream_id][1].extend(event.data)
+                self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+            elif isinstance(event, h2.events.StreamEnded):
+                asyncio.ensure_future(self.respond(event.stream_id))
+            elif isinstance(event, h2.events.StreamReset):
+                self.streams.pop(event.stream_id, None)
+            elif isinstance(event, h2.events.WindowUpdated):
+                self.window_open.set()
+        self.transport.write(self.conn.data_to_send())
+
+    async def respond(self, stream_id: int):
+        headers, body = self.streams.pop(stream_id)
+        server = self.server
+        server.requests += 1
+        server.paths.append(headers[":path"])
+        server.active += 1
+        server.max_active = max(server.max_active, server.active)
+        try:
+            if server.latency:
+                await asyncio.sleep(server.latency)
+        finally:
+            server.active -= 1
+
+        url = f"http://{headers[':authority']}{headers[':path']}"
+        response = stub_upstream.handle(httpx.Request(headers[":method"], url, content=bytes(body)))
+        content = b"" if headers[":method"] == "HEAD" else response.content
+        if self.transport is None:
+            return
+        self.conn.send_headers(stream_id, [
+            (":status", str(response.status_code)),
+            ("content-type", response.headers.get("content-type", "application/octet-stream")),
+            ("content-length", str(len(response.content))),
+        ], end_stream=not content)
+        self.transport.write(self.conn.data_to_send())
+        await self._send_body(stream_id, content)
+
+    async def _send_body(self, stream_id: int, content: bytes):
+        view = memoryview(content)
+        while view and self.transport is not None:
+            size = min(self.conn.local_flow_control_window(stream_id), self.conn.max_outbound_frame_size, len(view))
+            if size <= 0:
+                self.window_open.clear()
+                await self.window_open.wait()
+                continue
+            self.conn.send_data(stream_id, bytes(view[:size]), end_stream=size == len(view))
+            self.transport.write(self.conn.data_to_send())
+            view = view[size:]
+
+async def serve(host: str = "127.0.0.1", port: int = 0, latency: float = 0.0) -> tuple[asyncio.Server, StubH2Server]:
+    stub = StubH2Server(latency)
+    loop = asyncio.get_running_loop()
+    server = await loop.create_server(lambda: _H2Protocol(stub), host, port)
+    return server, stub
+
+# Sends every upstream request, whatever its host, to the stand-in. The inner transport
+# is configured like the shared pool, so without MOVIEBOX_HTTP2=1 it speaks HTTP/1.1 and
+# the check fails. Over cleartext HTTP/2 needs prior knowledge, hence http1=False.
+class OriginTransport(httpx.AsyncBaseTransport):
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.inner = httpx.AsyncHTTPTransport(http1=not upstream.HTTP2, http2=upstream.HTTP2, limits=upstream.LIMITS)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.url = request.url.copy_with(scheme="http", host=self.host, port=self.port)
+        return await self.inner.handle_async_request(request)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+CHECK_PATHS = [
+    "/home",
+    "/search?q=avatar",
+    "/search/suggest?q=avatar",
+    "/api/stream/8906247916759695608?detail_path=tokyo-ghoul-hindi-OlanoKZKGR2",
+]
+
+async def check(requests: int, latency: float) -> int:
+    import api
+
+    server, stub = await serve(latency=latency)
+    port = server.sockets[0].getsockname()[1]
+    upstream.UPSTREAM_TRANSPORT = OriginTransport("127.0.0.1", port)
+    if not upstream.HTTP2:
+        print("MOVIEBOX_HTTP2 is not set: the pool uses HTTP/1.1, which the stand-in does not speak")
+    async with server, api.lifespan(api.app):
+        warmed = stub.connections
+        print(f"pre-warm: {stub.requests} requests on {warmed} connection(s): {', '.join(stub.paths)}")
+        stub.paths.clear()
+        before = stub.requests
+
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://check") as client:
+            start = time.perf_counter()
+            paths = [CHECK_PATHS[i % len(CHECK_PATHS)] for i in range(requests)]
+            responses = await asyncio.gather(*(client.get(p) for p in paths))
+            elapsed = time.perf_counter() - start
+
+        failed = [r for r in responses if r.status_code != 200]
+        print(f"{requests} API requests -> {stub.requests - before} upstream requests in {elapsed * 1000:.0f} ms "
+              f"(injected latency {latency * 1000:.0f} ms)")
+        print(f"connections opened after pre-warm: {stub.connections - warmed}")
+        print(f"max concurrent streams on the stand-in: {stub.max_active}")
+        if failed:
+            print(f"FAILED: {len(failed)} responses were not 200, e.g. {failed[0].status_code} {failed[0].text[:200]}")
+        await upstream.UPSTREAM_TRANSPORT.aclose()
+        return 1 if failed or stub.connections != warmed else 0
+
+async def main(host: str, port: int, latency: float):
+    server, _ = await serve(host, port, latency)
+    print(f"stand-in HTTP/2 upstream listening on {host}:{server.sockets[0].getsockname()[1]} (h2c, prior knowledge)")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP/2 stand-in for the upstream API hosts")
+    parser.add_argument("--check", action="store_true",
+                        help="run the app against the stand-in and report connection reuse and multiplexing")
+    parser.add_argument("--requests", type=int, default=40, help="concurrent API requests for --check")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--latency", type=float, default=100.0, help="injected latency per request in ms")
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(asyncio.run(check(args.requests, args.latency / 1000)))
+    try:
+        asyncio.run(main(args.host, args.port, args.latency / 1000))
+    except KeyboardInterrupt:
+        pass
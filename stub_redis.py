@@ -0,0 +1,100 @@
+import time
+import asyncio
+import argparse
+
+# Minimal in-memory stand-in for the Redis commands cache.RedisCache uses
+# (PING, AUTH, SELECT, GET, SET [NX] [PX|EX], DEL, FLUSHDB, DBSIZE)
+
+class StubRedis:
+    def __init__(self):
+        self.data: dict[bytes, tuple[bytes, float]] = {}
+        self.commands = 0
+
+    def _get(self, key: bytes):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires and expires <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def execute(self, args: list[bytes]):
+        self.commands += 1
+        name = args[0].upper()
+        if name == b"PING":
+            return "PONG"
+        if name in (b"AUTH", b"SELECT"):
+            return "OK"
+        if name == b"GET":
+            return self._get(args[1])
+        if name == b"SET":
+            key, value, options = args[1], args[2], [a.upper() for a in args[3:]]
+            expires = 0.0
+            if b"PX" in options:
+                expires = time.monotonic() + int(options[options.index(b"PX") + 1]) / 1000
+            elif b"EX" in options:
+                expires = time.monotonic() + int(options[options.index(b"EX") + 1])
+            if b"NX" in options and self._get(key) is not None:
+                return None
+            self.data[key] = (value, expires)
+            return "OK"
+        if name == b"DEL":
+            return sum(self.data.pop(key, None) is not None for key in args[1:])
+        if name == b"FLUSHDB":
+            self.data.clear()
+            return "OK"
+        if name == b"DBSIZE":
+            return len(self.data)
+        return Exception(f"ERR unknown command '{args[0].decode()}'")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                count = int(line[1:-2])
+                args = []
+                for _ in range(count):
+                    size = int((await reader.readline())[1:-2])
+                    args.append((await reader.readexactly(size + 2))[:-2])
+                writer.write(encode_reply(self.execute(args)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+def encode_reply(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, Exception):
+        return b"-%s\r\n" % str(value).encode()
+    if isinstance(value, str):
+        return b"+%s\r\n" % value.encode()
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+async def serve(host: str = "127.0.0.1", port: int = 0) -> tuple[asyncio.Server, StubRedis]:
+    stub = StubRedis()
+    server = await asyncio.start_server(stub.handle, host, port)
+    return server, stub
+
+async def main(host: str, port: int):
+    server, _ = await serve(host, port)
+    print(f"stand-in redis listening on {host}:{server.sockets[0].getsockname()[1]}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-memory Redis stand-in for testing MOVIEBOX_CACHE=redis://")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
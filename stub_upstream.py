@@ -0,0 +1,117 @@
+import os
+import sys
+import random
+import asyncio
+import argparse
+import httpx
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# path -> fixture; "/detail/" matches any detail page
+ROUTES = {
+    "/wefeed-h5api-bff/home": "home.json",
+    "/wefeed-h5api-bff/subject/search-suggest": "search-suggest.json",
+    "/wefeed-h5api-bff/subject/search": "search.json",
+    "/wefeed-h5api-bff/media-player/get-domain": "get-domain.json",
+    "/wefeed-h5api-bff/subject/play": "play.json",
+    "/": "homepage.html",
+    "/web/movie": "movie.html",
+    "/web/tv-series": "tv-series.html",
+    "/web/animated-series": "animation.html",
+    "/ranking-list": "ranking.html",
+    "/detail/": "detail.html",
+}
+# Any poster on the image CDN is answered with the same picture
+POSTER_HOST = "pbcdnw.aoneroom.com"
+POSTER_FIXTURE = "poster.jpg"
+
+_fixtures: dict[str, bytes] = {}
+
+def load_fixture(name: str) -> bytes:
+    data = _fixtures.get(name)
+    if data is None:
+        with open(os.path.join(FIXTURE_DIR, name), "rb") as f:
+            data = _fixtures[name] = f.read()
+    return data
+
+def fixture_text(name: str) -> str:
+    return load_fixture(name).decode("utf-8")
+
+def fixture_for(path: str):
+    if path.startswith("/detail/"):
+        return ROUTES["/detail/"]
+    return ROUTES.get(path)
+
+def handle(request: httpx.Request) -> httpx.Response:
+    if request.url.host == POSTER_HOST:
+        return httpx.Response(200, content=load_fixture(POSTER_FIXTURE), headers={"Content-Type": "image/jpeg"})
+    name = fixture_for(request.url.path)
+    if name is None:
+        return httpx.Response(404, text=f"no fixture for {request.url.path}")
+    content_type = "application/json" if name.endswith(".json") else "text/html; charset=utf-8"
+    return httpx.Response(200, content=load_fixture(name), headers={"Content-Type": content_type})
+
+class StubTransport(httpx.AsyncBaseTransport):
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        return handle(request)
+
+def install(latency: float = 0.0, jitter: float = 0.0) -> StubTransport:
+    import upstream
+    transport = StubTransport(latency, jitter)
+    upstream.UPSTREAM_TRANSPORT = transport
+    return transport
+
+# ---- Recording live fixtures ----
+
+UA = {"User-Agent": "Mozilla/5.0"}
+JSON_HEADERS = {**UA, "Content-Type": "application/json"}
+BFF = "https://h5-api.aoneroom.com/wefeed-h5api-bff"
+
+async def record(slug: str, subject_id: str):
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    async with httpx.AsyncClient(follow_redirects=True, timeout=30) as client:
+        async def save(name, method, url, **kwargs):
+            resp = await client.request(method, url, **kwargs)
+            resp.raise_for_status()
+            with open(os.path.join(FIXTURE_DIR, name), "wb") as f:
+                f.write(resp.content)
+            print(f"  {name:22s} {len(resp.content):>9,d} bytes  <- {url}")
+            return resp
+
+        await save("home.json", "GET", f"{BFF}/home?host=moviebox.ph", headers=UA)
+        await save("search.json", "POST", f"{BFF}/subject/search",
+                   json={"keyword": "avatar", "perPage": 30, "page": 1}, headers=JSON_HEADERS)
+        await save("search-suggest.json", "POST", f"{BFF}/subject/search-suggest",
+                   json={"keyword": "avatar", "perPage": 10}, headers=JSON_HEADERS)
+        dom = await save("get-domain.json", "GET", f"{BFF}/media-player/get-domain", headers=UA)
+        domain = dom.json().get("data", "https://123movienow.cc").rstrip("/")
+        await save("play.json", "GET",
+                   f"{domain}/wefeed-h5api-bff/subject/play?subjectId={subject_id}&se=0&ep=0&detailPath={slug}",
+                   headers=UA, cookies={"uuid": "d8c3539e-2e46-4000-af20-7046a856e30a"})
+        for path, name in ROUTES.items():
+            if name.endswith(".html"):
+                url = "https://moviebox.ph" + (f"/detail/{slug}" if path == "/detail/" else path)
+                await save(name, "GET", url, headers=UA)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline stand-in for the moviebox.ph upstreams")
+    parser.add_argument("--record", action="store_true", help="re-record fixtures from the live site")
+    parser.add_argument("--slug", default="tokyo-ghoul-hindi-OlanoKZKGR2")
+    parser.add_argument("--subject-id", help="subjectId of --slug, needed for play.json (required with --record)")
+    args = parser.parse_args()
+    if not args.record:
+        parser.print_help()
+        sys.exit(0)
+    if not args.subject_id:
+        # Without it play.json is recorded with no streams and endpoint[/api/stream] 404s
+        parser.error("--record needs --subject-id")
+    asyncio.run(record(args.slug, args.subject_id))
@@ -0,0 +1,196 @@
+import socket
+import asyncio
+
+import pytest
+
+import cache
+import stub_redis
+
+BACKENDS = ["memory", "sqlite", "redis"]
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(cache, "_suspended_until", 0.0)
+    monkeypatch.setattr(cache, "_inflight", {})
+    monkeypatch.setattr(cache, "POLL_INTERVAL", 0.01)
+
+# Runs test(first, second) against two clients of one store, standing in for two
+# workers; the memory backend is per process, so both are the same instance
+def run(kind: str, tmp_path, test):
+    async def go():
+        server = None
+        if kind == "memory":
+            first = second = cache.MemoryCache()
+        elif kind == "sqlite":
+            path = str(tmp_path / "cache.sqlite")
+            first, second = cache.SQLiteCache(path), cache.SQLiteCache(path)
+        else:
+            server, _ = await stub_redis.serve()
+            port = server.sockets[0].getsockname()[1]
+            first, second = cache.RedisCache("127.0.0.1", port), cache.RedisCache("127.0.0.1", port)
+        try:
+            return await test(first, second)
+        finally:
+            await first.close()
+            await second.close()
+            if server is not None:
+                server.close()
+                await asyncio.sleep(0.01)
+    return asyncio.run(go())
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_get_set_ttl(kind, tmp_path):
+    async def test(first, second):
+        assert await first.get("k") is None
+        await first.set("k", {"sections": [1, 2]}, 60)
+        assert await second.get("k") == {"sections": [1, 2]}
+        await first.set("short", "v", 0.05)
+        assert await second.get("short") == "v"
+        await asyncio.sleep(0.1)
+        assert await second.get("short") is None
+        await second.delete("k")
+        assert await first.get("k") is None
+    run(kind, tmp_path, test)
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_lock_is_exclusive(kind, tmp_path):
+    async def test(first, second):
+        token = await first.acquire("k", 10)
+        assert token is not None
+        assert await second.acquire("k", 10) is None
+        await second.release("k", "not-the-token")
+        assert await second.acquire("k", 10) is None
+        await first.release("k", token)
+        other = await second.acquire("k", 10)
+        assert other is not None and other != token
+        await second.release("k", other)
+    run(kind, tmp_path, test)
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_lock_expires(kind, tmp_path):
+    async def test(first, second):
+        assert await first.acquire("k", 0.05) is not None
+        assert await second.acquire("k", 0.05) is None
+        await asyncio.sleep(0.1)
+        assert await second.acquire("k", 0.05) is not None
+    run(kind, tmp_path, test)
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_waiter_gets_holders_value(kind, tmp_path):
+    async def test(first, second):
+        calls = []
+        done = asyncio.Event()
+
+        async def build(name):
+            calls.append(name)
+            await done.wait()
+            return {"built_by": name}
+
+        holder = asyncio.create_task(cache._refresh(first, "home", "k", lambda: build("first")))
+        await asyncio.sleep(0.05)
+        waiter = asyncio.create_task(cache._refresh(second, "home", "k", lambda: build("second")))
+        await asyncio.sleep(0.05)
+        done.set()
+        return calls, await holder, await waiter
+    calls, held, waited = run(kind, tmp_path, test)
+    assert calls == ["first"]
+    assert held == waited == {"built_by": "first"}
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_waiter_takes_over_after_lock_wait(kind, tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "LOCK_WAIT", 0.1)
+    async def test(first, second):
+        assert await first.acquire("k", 10) is not None
+        async def build():
+            return "own"
+        return await cache._refresh(second, "home", "k", build)
+    assert run(kind, tmp_path, test) == "own"
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_cached_builds_once(kind, tmp_path, monkeypatch):
+    async def test(first, second):
+        monkeypatch.setattr(cache, "BACKEND", first)
+        calls = []
+
+        @cache.cached("stream")
+        async def sources(subject_id: str, detail_path: str, se: int = 0, ep: int = 0):
+            calls.append((subject_id, detail_path))
+            await asyncio.sleep(0.02)
+            return [subject_id, detail_path]
+
+        results = await asyncio.gather(*(sources("1", "x") for _ in range(5)))
+        # Arguments that used to join to the same key
+        assert await sources("1:x", "y") == ["1:x", "y"]
+        assert await sources("1", "x:y") == ["1", "x:y"]
+        assert await sources("1", "x") == ["1", "x"]
+        return calls, results
+    calls, results = run(kind, tmp_path, test)
+    assert results == [["1", "x"]] * 5
+    assert calls == [("1", "x"), ("1:x", "y"), ("1", "x:y")]
+
+@pytest.mark.parametrize("kind", ["sqlite", "redis"])
+def test_unreadable_entry_is_a_miss(kind, tmp_path):
+    async def test(first, second):
+        await first.set("k", "v", 60)
+        if kind == "sqlite":
+            await first._run(lambda: first._connect().execute("UPDATE cache SET value = ?", (b"\x80\x05garbage",)))
+        else:
+            await first.execute("SET", "k", b"\x80\x05garbage")
+        assert await second.get("k") is None
+        if kind == "redis":
+            assert await first.execute("GET", "k") is None
+        await first.set("k", "v2", 60)
+        assert await second.get("k") == "v2"
+    run(kind, tmp_path, test)
+
+def _suspend_check(backend):
+    async def go():
+        calls = []
+        real_execute = backend.execute
+
+        async def execute(*args):
+            calls.append(args[0])
+            return await real_execute(*args)
+        backend.execute = execute
+        cache.BACKEND = backend
+        try:
+            @cache.cached("home")
+            async def home():
+                return {"ok": True}
+            first = await home()
+            tried = len(calls)
+            second = await home()
+            return first, second, tried, len(calls)
+        finally:
+            cache.BACKEND = None
+    return go()
+
+def test_unreachable_backend_is_suspended(monkeypatch):
+    monkeypatch.setattr(cache, "BACKEND", None)
+    backend = cache.RedisCache("127.0.0.1", free_port(), timeout=0.5)
+    first, second, tried, total = asyncio.run(_suspend_check(backend))
+    assert first == second == {"ok": True}
+    assert tried > 0 and total == tried
+    assert cache._suspended_until > 0
+
+def test_rejected_auth_is_suspended(monkeypatch):
+    monkeypatch.setattr(cache, "BACKEND", None)
+    async def go():
+        async def handle(reader, writer):
+            while await reader.read(4096):
+                writer.write(b"-WRONGPASS invalid username-password pair\r\n")
+            writer.close()
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        backend = cache.RedisCache("127.0.0.1", server.sockets[0].getsockname()[1], password="wrong")
+        try:
+            return await _suspend_check(backend)
+        finally:
+            server.close()
+    first, second, tried, total = asyncio.run(go())
+    assert first == second == {"ok": True}
+    assert tried > 0 and total == tried
@@ -0,0 +1,143 @@
+import json
+import time
+import asyncio
+
+import pytest
+
+import cache
+import home_feed
+from records import FeedCard, FeedSection, dumps
+
+@pytest.fixture(autouse=True)
+def fresh_history(monkeypatch):
+    monkeypatch.setattr(cache, "BACKEND", None)
+    monkeypatch.setattr(home_feed, "_local", cache.MemoryCache(32))
+    monkeypatch.setattr(home_feed, "_deltas", {})
+
+def card(slug: str, name: str = None) -> FeedCard:
+    return FeedCard(name or slug.title(), f"https://moviebox.ph/detail/{slug}", slug, f"https://img/{slug}.jpg")
+
+def feed(**sections) -> list:
+    return [FeedSection(name, [card(s) for s in slugs.split()]) for name, slugs in sections.items()]
+
+def body(sections) -> bytes:
+    return dumps(sections)
+
+async def publish(sections, raw: bytes = None) -> dict:
+    version = await home_feed.stamp(sections, body(sections) if raw is None else raw)
+    return {"version": version, "total_sections": len(sections), "sections": sections}
+
+def _json(value):
+    return json.loads(dumps(value))
+
+def _card_key(c: dict) -> str:
+    return c["slug"] or c["url"] or c["name"] or ""
+
+# Rebuilds the new sections from the old ones and a delta, the way a client would
+def apply(old_sections: list, delta: dict) -> list:
+    old_sections = _json(old_sections)
+    by_key = dict(zip(home_feed._unique([s["section"] for s in old_sections]), old_sections))
+    order = delta.get("order", list(by_key))
+    for key in delta["removed"]:
+        del by_key[key]
+    by_key.update(_json(delta["added"]))
+    for key, change in _json(delta["changed"]).items():
+        section = by_key[key]
+        cards = dict(zip(home_feed._unique([_card_key(c) for c in section["movies"]]), section["movies"]))
+        card_order = change.get("order", list(cards))
+        for ckey in change["removed"]:
+            del cards[ckey]
+        cards.update(change["cards"])
+        section["movies"] = [cards[ckey] for ckey in card_order]
+        section["count"], section["more_url"] = change["count"], change["more_url"]
+    return [by_key[key] for key in order]
+
+def delta_between(old_sections, new_sections) -> dict:
+    async def run():
+        old = await publish(old_sections)
+        new = await publish(new_sections)
+        return old, new, await home_feed.changes(old["version"], new)
+    old, new, result = asyncio.run(run())
+    assert result["version"] == new["version"] != old["version"]
+    assert result["since"] == old["version"] and result["full"] is False
+    assert apply(old_sections, result) == _json(new_sections)
+    return result
+
+def test_unchanged_body_keeps_version():
+    async def run():
+        sections = feed(Trending="a b c")
+        first = await publish(sections)
+        second = await publish(feed(Trending="a b c"))
+        return first, second, await home_feed.changes(first["version"], second)
+    first, second, result = asyncio.run(run())
+    assert second["version"] == first["version"]
+    assert result == {"version": first["version"], "since": first["version"], "full": False,
+                      "added": {}, "removed": [], "changed": {}}
+
+def test_same_content_in_new_body_keeps_version():
+    async def run():
+        first = await publish(feed(Trending="a b"), b'{"ignored": 1}')
+        second = await publish(feed(Trending="a b"), b'{"ignored": 2}')
+        return first["version"], second["version"]
+    first, second = asyncio.run(run())
+    assert first == second
+
+def test_unchanged_feed_outlives_history_ttl(monkeypatch):
+    monkeypatch.setattr(home_feed, "HISTORY_TTL", 0.2)
+    async def run():
+        first = await publish(feed(Trending="a b"))
+        later = first
+        for _ in range(3):
+            await asyncio.sleep(0.12)
+            later = await publish(feed(Trending="a b"))
+        return first, later, await home_feed.changes(first["version"], later)
+    first, later, result = asyncio.run(run())
+    assert later["version"] == first["version"]
+    assert result["full"] is False
+
+def test_card_changed():
+    old = feed(Trending="a b c", Hot="x y")
+    new = feed(Trending="a b c", Hot="x y")
+    new[0].movies[1] = card("b", "Renamed")
+    result = delta_between(old, new)
+    assert list(result["changed"]) == ["Trending"]
+    change = result["changed"]["Trending"]
+    assert list(change["cards"]) == ["b"] and change["removed"] == [] and "order" not in change
+    assert "order" not in result and result["added"] == {} and result["removed"] == []
+
+def test_card_added_and_removed():
+    result = delta_between(feed(Trending="a b c"), feed(Trending="d a c"))
+    change = result["changed"]["Trending"]
+    assert list(change["cards"]) == ["d"]
+    assert change["removed"] == ["b"]
+    assert change["order"] == ["d", "a", "c"]
+    assert change["count"] == 3
+
+def test_section_dropped_and_added():
+    result = delta_between(feed(Trending="a", Hot="b", Cinema="c"), feed(Trending="a", Cinema="c", New="d"))
+    assert result["removed"] == ["Hot"]
+    assert list(result["added"]) == ["New"]
+    assert result["order"] == ["Trending", "Cinema", "New"]
+    assert result["changed"] == {}
+
+def test_repeated_keys():
+    result = delta_between(feed(Trending="a a b"), feed(Trending="a b a"))
+    assert result["changed"]["Trending"]["order"] == ["a", "b", "a#2"]
+
+def test_expired_since_returns_full_feed():
+    async def run():
+        data = await publish(feed(Trending="a b"))
+        return data, await home_feed.changes(data["version"] - 60000, data)
+    data, result = asyncio.run(run())
+    assert result["full"] is True
+    assert result["since"] == data["version"] - 60000
+    assert result["sections"] is data["sections"]
+
+def test_versions_increase():
+    async def run():
+        first = await publish(feed(Trending="a"))
+        second = await publish(feed(Trending="b"))
+        return first["version"], second["version"]
+    first, second = asyncio.run(run())
+    assert second > first
+    assert abs(first - time.time() * 1000) < 60000
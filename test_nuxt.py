@@ -0,0 +1,53 @@
+import json
+import random
+
+import pytest
+
+import nuxt
+from stub_upstream import fixture_text
+
+FIXTURES = ["detail.html", "movie.html", "tv-series.html", "animation.html", "ranking.html", "homepage.html"]
+
+# Numbers in every shape the scanner can cut short, nested and at the top level
+NUMBERS = [7.5, 1e3, 2.5e+2, -0.25, 0, -12, 3.0e-4, 10, {"a": 1.5, "b": [2e10, -3]}, True, None, "x", 123456789]
+
+def _page(data) -> str:
+    return f'<html><script type="application/json" id="__NUXT_DATA__">{json.dumps(data)}</script></html>'
+
+def _feed(html: str, rng: random.Random) -> list:
+    stream = nuxt.ArrayStream()
+    data = []
+    pos = 0
+    while pos < len(html):
+        size = rng.randint(1, 5)
+        for index, value in stream.feed(html[pos:pos + size]):
+            assert index == len(data)
+            data.append(value)
+        pos += size
+    stream.close()
+    return data
+
+@pytest.mark.parametrize("name", FIXTURES)
+def test_stream_matches_decode(name):
+    html = fixture_text(name)
+    assert _feed(html, random.Random(name)) == nuxt.decode(html)
+
+@pytest.mark.parametrize("seed", range(50))
+def test_stream_numbers(seed):
+    html = _page(NUMBERS).replace("1000.0", "1e3").replace("250.0", "2.5E+2")
+    expected = json.loads(html[html.index("["):html.rindex("]") + 1])
+    assert _feed(html, random.Random(seed)) == expected
+
+@pytest.mark.parametrize("chunks", [["[7.", "5,1]"], ["[1e", "3]"], ["[2.5E+", "2]"], ["[-", "4]"], ["[10", "0]"]])
+def test_stream_split_number(chunks):
+    stream = nuxt.ArrayStream()
+    stream.feed('<script id="__NUXT_DATA__">')
+    data = [value for chunk in chunks for _, value in stream.feed(chunk)]
+    stream.close()
+    assert data == json.loads("".join(chunks))
+
+def test_stream_truncated():
+    stream = nuxt.ArrayStream()
+    stream.feed(_page([1, 2.5])[:-20])
+    with pytest.raises(nuxt.NuxtDataError):
+        stream.close()
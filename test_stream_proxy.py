@@ -0,0 +1,176 @@
+import asyncio
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+import upstream
+import stream_proxy
+
+SEGMENT = bytes(range(256)) * 1024
+ORIGIN = "https://cdn.example.com"
+
+async def _body(data: bytes):
+    yield data
+
+class Upstream:
+    def __init__(self):
+        self.requests: list[httpx.Request] = []
+        self.gate = None
+        self.fail = False
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        if self.fail:
+            raise httpx.ConnectError("connection refused", request=request)
+        if self.gate is not None:
+            await self.gate.wait()
+        path = request.url.path
+        if path.endswith(".m3u8"):
+            return httpx.Response(200, text="#EXTM3U\n#EXTINF:4,\nseg1.ts\n")
+        if "range" in request.headers:
+            start, end = map(int, request.headers["range"].removeprefix("bytes=").split("-"))
+            return httpx.Response(206, content=_body(SEGMENT[start:end + 1]), headers={
+                "Content-Type": "video/mp2t",
+                "Content-Range": f"bytes {start}-{end}/{len(SEGMENT)}",
+            })
+        return httpx.Response(200, content=_body(SEGMENT), headers={"Content-Type": "video/mp2t"})
+
+    def hits(self, path: str) -> int:
+        return sum(1 for r in self.requests if r.url.path == path)
+
+# Unlike httpx.MockTransport, leaves the body unread so it can be streamed like a real one
+class Transport(httpx.AsyncBaseTransport):
+    def __init__(self, handler):
+        self.handler = handler
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.handler(request)
+
+@pytest.fixture
+def origin(monkeypatch, tmp_path):
+    mock = Upstream()
+    monkeypatch.setattr(upstream, "UPSTREAM_TRANSPORT", Transport(mock.handle))
+    monkeypatch.setattr(stream_proxy, "CACHE_DIR", str(tmp_path))
+    stream_proxy.segment_cache.cache_clear()
+    yield mock
+    stream_proxy.segment_cache.cache_clear()
+
+def client() -> httpx.AsyncClient:
+    app = FastAPI()
+    app.include_router(stream_proxy.router)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://proxy")
+
+def run(coro):
+    return asyncio.run(coro)
+
+def _target(line: str) -> tuple[str, bool]:
+    query = parse_qs(urlsplit(line).query)
+    url = query["url"][0]
+    assert query["sig"][0] == stream_proxy.sign(url)
+    return url, query.get("seg") == ["1"]
+
+# ---- Playlist rewriting ----
+
+def test_rewrite_master_playlist():
+    text = "#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=800000\n720p/index.m3u8\n#EXT-X-STREAM-INF:BANDWIDTH=400000\nhttps://other.example.com/m3u8/480p\n"
+    lines = stream_proxy.rewrite_playlist(text, ORIGIN + "/movie/master.m3u8").splitlines()
+    assert lines[0] == "#EXTM3U" and lines[1].startswith("#EXT-X-STREAM-INF")
+    assert _target(lines[2]) == (ORIGIN + "/movie/720p/index.m3u8", False)
+    assert _target(lines[4]) == ("https://other.example.com/m3u8/480p", False)
+
+def test_rewrite_media_playlist():
+    text = (
+        "#EXTM3U\n"
+        '#EXT-X-KEY:METHOD=AES-128,URI="../keys/k1.key",IV=0x1\n'
+        '#EXT-X-MAP:URI="init.mp4"\n'
+        "#EXTINF:4,\n"
+        "seg1.ts\n"
+        "#EXTINF:4,\n"
+        "  /abs/seg2.ts  \n"
+        "\n"
+    )
+    lines = stream_proxy.rewrite_playlist(text, ORIGIN + "/movie/720p/index.m3u8").splitlines()
+    key_uri = lines[1].split('URI="')[1].split('"')[0]
+    assert _target(key_uri) == (ORIGIN + "/movie/keys/k1.key", True)
+    assert lines[1].endswith(",IV=0x1")
+    assert _target(lines[2].split('URI="')[1].rstrip('"')) == (ORIGIN + "/movie/720p/init.mp4", True)
+    assert _target(lines[4]) == (ORIGIN + "/movie/720p/seg1.ts", True)
+    assert _target(lines[6]) == (ORIGIN + "/abs/seg2.ts", True)
+    assert lines[7] == ""
+
+def test_playlist_relayed_rewritten(origin):
+    async def go():
+        async with client() as c:
+            return await c.get(stream_proxy.proxy_url(ORIGIN + "/movie/index.m3u8"))
+    resp = run(go())
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/vnd.apple.mpegurl"
+    assert _target(resp.text.splitlines()[2]) == (ORIGIN + "/movie/seg1.ts", True)
+
+# ---- Signatures ----
+
+@pytest.mark.parametrize("sig", ["0" * 32, "", "é", "é" * 32])
+def test_bad_signature(origin, sig):
+    async def go():
+        async with client() as c:
+            return await c.get("/proxy/stream", params={"url": ORIGIN + "/a.ts", "sig": sig})
+    assert run(go()).status_code == 403
+    assert origin.requests == []
+
+# ---- Segments ----
+
+def test_concurrent_viewers_share_one_download(origin):
+    url = stream_proxy.proxy_url(ORIGIN + "/movie/seg1.ts", segment=True)
+    async def go():
+        origin.gate = asyncio.Event()
+        async with client() as c:
+            requests = [asyncio.ensure_future(c.get(url)) for _ in range(3)]
+            await asyncio.sleep(0.05)
+            origin.gate.set()
+            return await asyncio.gather(*requests)
+    responses = run(go())
+    assert [r.status_code for r in responses] == [200, 200, 200]
+    assert all(r.content == SEGMENT for r in responses)
+    assert origin.hits("/movie/seg1.ts") == 1
+    assert stream_proxy._transfers == {}
+    assert stream_proxy.segment_cache().get(stream_proxy.segment_cache().key(ORIGIN + "/movie/seg1.ts"))
+
+def test_range_on_uncached_segment_is_relayed(origin):
+    url = stream_proxy.proxy_url(ORIGIN + "/movie/seg2.ts", segment=True)
+    async def go():
+        async with client() as c:
+            return await c.get(url, headers={"Range": "bytes=100-199"})
+    resp = run(go())
+    assert resp.status_code == 206
+    assert resp.content == SEGMENT[100:200]
+    assert resp.headers["content-range"] == f"bytes 100-199/{len(SEGMENT)}"
+    assert origin.requests[0].headers["range"] == "bytes=100-199"
+    cache = stream_proxy.segment_cache()
+    assert cache.get(cache.key(ORIGIN + "/movie/seg2.ts")) is None
+
+def test_range_on_cached_segment_is_served_locally(origin):
+    url = stream_proxy.proxy_url(ORIGIN + "/movie/seg3.ts", segment=True)
+    async def go():
+        async with client() as c:
+            full = await c.get(url)
+            ranged = await c.get(url, headers={"Range": "bytes=100-199"})
+            return full, ranged
+    full, ranged = run(go())
+    assert full.content == SEGMENT
+    assert ranged.status_code == 206
+    assert ranged.content == SEGMENT[100:200]
+    assert origin.hits("/movie/seg3.ts") == 1
+
+def test_segment_failing_before_headers(origin):
+    origin.fail = True
+    async def go():
+        async with client() as c:
+            return await c.get(stream_proxy.proxy_url(ORIGIN + "/movie/seg4.ts", segment=True))
+    resp = run(go())
+    assert resp.status_code == 502
+    assert "ConnectError" in resp.json()["detail"]
+    assert stream_proxy._transfers == {}
+    cache = stream_proxy.segment_cache()
+    assert cache.get(cache.key(ORIGIN + "/movie/seg4.ts")) is None
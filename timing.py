@@ -0,0 +1,40 @@
+import time
+import contextvars
+from contextlib import contextmanager
+
+STAGES = ("cache", "fetch", "decode", "nuxt-parse", "map-build", "html-parse", "extract", "serialize")
+
+_stages: contextvars.ContextVar = contextvars.ContextVar("stages", default=None)
+
+def begin() -> tuple[contextvars.Token, dict]:
+    recorded: dict[str, float] = {}
+    return _stages.set(recorded), recorded
+
+def end(token: contextvars.Token):
+    _stages.reset(token)
+
+@contextmanager
+def stage(name: str):
+    recorded = _stages.get()
+    if recorded is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorded[name] = recorded.get(name, 0.0) + time.perf_counter() - start
+
+def record(name: str, seconds: float):
+    recorded = _stages.get()
+    if recorded is not None:
+        recorded[name] = recorded.get(name, 0.0) + seconds
+
+def server_timing(recorded: dict, total: float = 0.0) -> str:
+    entries = [
+        f"{name};dur={recorded[name] * 1000:.2f}"
+        for name in STAGES if name in recorded
+    ]
+    if total:
+        entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
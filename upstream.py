@@ -0,0 +1,136 @@
+import os
+import time
+import asyncio
+import contextvars
+import http.cookiejar
+from contextlib import asynccontextmanager
+import httpx
+
+import metrics
+import timing
+
+BASE_URL = "https://moviebox.ph"
+
+HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/122.0.0.0 Safari/537.36"
+    ),
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Connection": "keep-alive",
+    "Referer": "https://moviebox.ph/",
+}
+
+# Set per request by the HTTP middleware in api.py
+current_scope: contextvars.ContextVar = contextvars.ContextVar("current_scope", default=None)
+
+def route_label() -> str:
+    scope = current_scope.get()
+    if scope is None:
+        return "none"
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+async def _on_request(request: httpx.Request):
+    request.extensions["started_at"] = time.perf_counter()
+
+async def _on_response(response: httpx.Response):
+    request = response.request
+    host, route = request.url.host, route_label()
+    metrics.UPSTREAM_RESPONSES.inc(host=host, route=route, status=str(response.status_code))
+    # Streamed bodies are relayed as they arrive; only time-to-headers is recorded
+    streaming = request.extensions.get("streaming", False)
+    if not streaming:
+        await response.aread()
+    started = request.extensions.get("started_at")
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        metrics.UPSTREAM_LATENCY.observe(elapsed, host=host, route=route)
+        timing.record("fetch", elapsed)
+    if not streaming:
+        metrics.UPSTREAM_RESPONSE_BYTES.observe(len(response.content), host=host, route=route)
+
+# Replaced by stub_upstream.py in benchmarks and load tests
+UPSTREAM_TRANSPORT: httpx.AsyncBaseTransport = None
+
+def client(**kwargs) -> httpx.AsyncClient:
+    if UPSTREAM_TRANSPORT is not None:
+        kwargs.setdefault("transport", UPSTREAM_TRANSPORT)
+    return httpx.AsyncClient(
+        event_hooks={"request": [_on_request], "response": [_on_response]},
+        **kwargs,
+    )
+
+# ---- Shared connection pool for the JSON API hosts ----
+
+HTTP2 = os.environ.get("MOVIEBOX_HTTP2", "") == "1"
+KEEPALIVE_INTERVAL = float(os.environ.get("MOVIEBOX_KEEPALIVE_INTERVAL", "30"))
+WARM_TIMEOUT = 5.0
+
+BFF_ORIGIN = "https://h5-api.aoneroom.com"
+DOMAIN_URL = BFF_ORIGIN + "/wefeed-h5api-bff/media-player/get-domain"
+PLAYER_FALLBACK = "https://123movienow.cc"
+
+# Idle connections must outlive the ping interval, or every ping opens a fresh one
+LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=max(KEEPALIVE_INTERVAL * 3, 5.0))
+
+# The pool is shared by every request, so it must not collect upstream cookies
+_NO_COOKIES = http.cookiejar.DefaultCookiePolicy(allowed_domains=[])
+
+_shared: httpx.AsyncClient = None
+_keepalive_task: asyncio.Task = None
+player_origin: str = None
+
+@asynccontextmanager
+async def session():
+    # The shared pool while the app is running; a one-off client when handlers are
+    # called outside the app's lifespan (bench.py)
+    if _shared is not None:
+        yield _shared
+        return
+    async with client() as c:
+        yield c
+
+async def ping():
+    # get-domain is the cheapest BFF call and also tells us which player host to keep warm
+    global player_origin
+    try:
+        resp = await _shared.get(DOMAIN_URL, headers={"User-Agent": "Mozilla/5.0"}, timeout=WARM_TIMEOUT)
+        domain = resp.json().get("data") if resp.status_code == 200 else None
+        if isinstance(domain, str) and domain.startswith("http"):
+            player_origin = domain.rstrip("/")
+    except (httpx.HTTPError, ValueError) as e:
+        print(f"Warning: keep-alive request to {BFF_ORIGIN} failed: {e!r}")
+    origin = player_origin or PLAYER_FALLBACK
+    try:
+        await _shared.head(origin + "/", headers={"User-Agent": "Mozilla/5.0"}, timeout=WARM_TIMEOUT)
+    except httpx.HTTPError as e:
+        print(f"Warning: keep-alive request to {origin} failed: {e!r}")
+
+async def _keepalive():
+    while True:
+        await asyncio.sleep(KEEPALIVE_INTERVAL)
+        await ping()
+
+async def start(warm: bool = True):
+    global _shared, _keepalive_task
+    _shared = client(http2=HTTP2, limits=LIMITS, cookies=http.cookiejar.CookieJar(_NO_COOKIES))
+    if warm:
+        # Bounded, so an unreachable upstream delays startup by at most WARM_TIMEOUT
+        try:
+            await asyncio.wait_for(ping(), WARM_TIMEOUT)
+        except asyncio.TimeoutError:
+            print("Warning: upstream pre-warm timed out")
+        if KEEPALIVE_INTERVAL > 0:
+            _keepalive_task = asyncio.create_task(_keepalive())
+
+async def stop():
+    global _shared, _keepalive_task
+    if _keepalive_task is not None:
+        _keepalive_task.cancel()
+        _keepalive_task = None
+    if _shared is not None:
+        await _shared.aclose()
+        _shared = None